@@ -0,0 +1,105 @@
+"""Defines the activation functions a neuron can use, each with a scalar and a vectorized form"""
+from math import exp, tanh
+
+import numpy as np
+
+
+class Activation:
+    """Pairs the scalar form of an activation function with a NumPy form that works on whole arrays
+
+    The vectorized form is called like a ufunc, vectorized(x, out=None), and may write its result into out.
+    """
+
+    def __init__(self, name, scalar, vectorized):
+        self.name = name
+        self.scalar = scalar
+        self.vectorized = vectorized
+
+
+def tanh_relu():
+    """Returns the tanh(relu()) activation, the original activation of every neuron"""
+    def vectorized(x, out=None):
+        out = np.maximum(x, 0, out=out)
+        return np.tanh(out, out=out)
+
+    return Activation("tanh(relu())", lambda x: tanh(max(0, x)), vectorized)
+
+
+def sigmoid():
+    """Returns the logistic sigmoid activation"""
+    def scalar(x):
+        if x < 0:
+            return exp(x) / (1 + exp(x))
+        return 1 / (1 + exp(-x))
+
+    def vectorized(x, out=None):
+        out = np.negative(x, out=out)
+        np.clip(out, -700, 700, out=out)
+        np.exp(out, out=out)
+        out += 1
+        return np.reciprocal(out, out=out)
+
+    return Activation("sigmoid", scalar, vectorized)
+
+
+def hill(half_saturation=0.5, coefficient=2):
+    """Returns a Hill function activation x^n / (K^n + x^n) of the positive part of its input
+
+    Args:
+        half_saturation (float): the input K at which the output is 0.5
+        coefficient (float): the Hill coefficient n, the steepness of the curve
+    """
+    constant = half_saturation ** coefficient
+
+    def scalar(x):
+        powered = max(0, x) ** coefficient
+        return powered / (constant + powered)
+
+    def vectorized(x, out=None):
+        out = np.maximum(x, 0, out=out)
+        np.power(out, coefficient, out=out)
+        return np.divide(out, out + constant, out=out)
+
+    return Activation("hill", scalar, vectorized)
+
+
+def threshold(level=0.5):
+    """Returns a step activation that is 1 once its input reaches a level and 0 below it
+
+    Args:
+        level (float): the input at which the output switches on
+    """
+    def vectorized(x, out=None):
+        if out is None:
+            out = np.empty_like(x, dtype=np.float64)
+        return np.greater_equal(x, level, out=out)
+
+    return Activation("threshold", lambda x: 1.0 if x >= level else 0.0, vectorized)
+
+
+DEFAULT_ACTIVATION = "tanh(relu())"
+ACTIVATIONS = {}
+
+
+def register_activation(activation):
+    """Makes an activation assignable to neurons by its name
+
+    Args:
+        activation (Activation): the activation to register
+    """
+    ACTIVATIONS[activation.name] = activation
+
+
+def get_activation(name):
+    """Returns the registered activation of a name
+
+    Args:
+        name (str): the name of the activation
+    """
+    if name not in ACTIVATIONS:
+        raise ValueError("Unknown activation " + repr(name) + ", choose one of " + ", ".join(ACTIVATIONS))
+    return ACTIVATIONS[name]
+
+
+for _activation in (tanh_relu(), sigmoid(), hill(), threshold()):
+    register_activation(_activation)
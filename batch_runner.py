@@ -0,0 +1,172 @@
+"""Runs simulations of KGML pathways from the command line without pygame or Qt
+
+Example:
+    python batch_runner.py kmgl_files/hsa05224.xml --model models/breast-cancer-model.txt
+        --steps 500 --tolerance 1e-9 --knockout-all --output knockouts.csv
+"""
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from kgml_parser import merge_kgml, parse_kgml
+from pathway_cache import PathwayCache
+from trajectory import TrajectoryRecorder
+
+
+def parse_args(argv):
+    """Reads the command line arguments
+
+    Args:
+        argv (list): the arguments after the program name
+    """
+    parser = argparse.ArgumentParser(description="Simulate KGML pathways headlessly and write the results")
+    parser.add_argument("kgml", nargs="+",
+                        help="KGML file(s) to simulate, several files are merged into one network by code")
+    parser.add_argument("--model", default="", help="text or binary model file to set the network up with")
+    parser.add_argument("--steps", type=int, default=1, help="the maximum number of steps to propagate")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="stop early once no value moves more than this in one step")
+    parser.add_argument("--set", action="append", default=[], metavar="CODE=VALUE",
+                        help="hold a code at a value in every scenario (repeatable)")
+    parser.add_argument("--knockout", action="append", default=[], metavar="CODE",
+                        help="add a scenario holding this code at 0 (repeatable)")
+    parser.add_argument("--knockout-all", action="store_true", help="add a knockout scenario for every code")
+    parser.add_argument("--scenarios", default=None,
+                        help="CSV of extra scenarios: a 'scenario' column, then one column per code, blank cells free")
+    parser.add_argument("--output", required=True, help="where to write the results, a .csv or .npz file")
+    parser.add_argument("--record", default=None,
+                        help="also write the values of every step of every scenario to a .csv or .npz file")
+    parser.add_argument("--record-steps", type=int, default=1024,
+                        help="the number of latest steps kept for --record")
+    parser.add_argument("--record-spill", default=None,
+                        help="keep the recorded steps in this memory-mapped .npy file instead of memory")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the KGML files")
+    return parser.parse_args(argv)
+
+
+def load_network(kgml_paths, use_cache):
+    """Loads one KGML file, or merges several, optionally through the pathway cache
+
+    Args:
+        kgml_paths (list): the KGML file paths
+        use_cache (bool): load through PathwayCache instead of parsing every time
+    """
+    load = PathwayCache().load if use_cache else parse_kgml
+    if len(kgml_paths) == 1:
+        return load(kgml_paths[0])
+    return merge_kgml(kgml_paths, load)
+
+
+def parse_value(text, where):
+    """Reads a number given on the command line or in a scenario file, exiting with where it is if it is not one
+
+    Args:
+        text (str): the number as written
+        where (str): the argument, or the file, line and column it was written in
+    """
+    try:
+        return float(text)
+    except ValueError:
+        raise SystemExit(f"Not a number in {where}: {text!r}") from None
+
+
+def build_scenarios(args, codes):
+    """Turns the perturbation arguments into a settings matrix
+
+    Args:
+        args (argparse.Namespace): the parsed arguments
+        codes (list): every code of the network
+
+    Returns:
+        tuple: the (scenarios x columns) settings, the code of every column and the label of every scenario
+    """
+    # Values held in every scenario
+    held = {}
+    for spec in args.set:
+        code, _, value = spec.rpartition("=")
+        held[code] = parse_value(value, "--set " + spec)
+
+    # The first scenario only holds the --set values, every other one adds its own changes on top
+    changes = [("baseline", {})]
+    knockouts = codes if args.knockout_all else args.knockout
+    for code in knockouts:
+        changes.append(("knockout " + code, {code: 0.0}))
+    if args.scenarios is not None:
+        with open(args.scenarios, newline="", encoding="utf8") as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                label = row.pop("scenario", "") or "scenario " + str(len(changes))
+                where = f"{args.scenarios}, line {reader.line_num}, column {{}}"
+                changes.append((label, {code: parse_value(value, where.format(code)) for code, value in row.items()
+                                        if value.strip() != ""}))
+
+    # Give every code that is changed anywhere a column, NaN leaves it free
+    columns = list(dict.fromkeys(list(held) + [code for _, change in changes for code in change]))
+    unknown = [code for code in columns if code not in codes]
+    if unknown:
+        raise SystemExit("Unknown code(s): " + ", ".join(unknown))
+    settings = np.full((len(changes), len(columns)), np.nan)
+    positions = {code: ind for ind, code in enumerate(columns)}
+    for row, (_, change) in enumerate(changes):
+        for code, value in list(held.items()) + list(change.items()):
+            settings[row, positions[code]] = value
+    return settings, columns, [label for label, _ in changes]
+
+
+def write_results(output_path, values, codes, labels):
+    """Writes the final values of every scenario as CSV or NPZ (chosen by the extension)
+
+    Args:
+        output_path (str): the file to write
+        values (np.ndarray): the (scenarios x codes) final values
+        codes (list): the code of every column
+        labels (list): the label of every scenario
+    """
+    if output_path.endswith(".npz"):
+        np.savez(output_path, values=values, codes=np.array(codes, dtype=str), scenarios=np.array(labels, dtype=str))
+        return
+
+    with open(output_path, "w", newline="", encoding="utf8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["scenario"] + list(codes))
+        for label, row in zip(labels, values.tolist()):
+            writer.writerow([label] + row)
+
+
+def main(argv=None):
+    """Runs the batch simulation described by the command line"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    network = load_network(args.kgml, not args.no_cache)
+    network.setup(args.model)
+    engine = network.compile()
+
+    # Point every column at one neuron of its code
+    settings, columns, labels = build_scenarios(args, engine.codes)
+    first_ids = {}
+    for id_, row in zip(engine.ids, engine.rows.tolist()):
+        first_ids.setdefault(engine.codes[row], id_)
+    recorder = None
+    if args.record:
+        recorder = TrajectoryRecorder((len(engine.codes), len(labels)), args.record_steps, args.record_spill)
+    values = network.simulate_scenarios(settings, [first_ids[code] for code in columns], args.steps, args.tolerance,
+                                        recorder)
+
+    write_results(args.output, values, engine.codes, labels)
+    print(f"Wrote {len(labels)} scenario(s) x {len(engine.codes)} code(s) to {args.output}")
+
+    # Write the recorded steps in the format chosen by the extension
+    if recorder is not None:
+        if args.record.endswith(".npz"):
+            recorder.export_npz(args.record, engine.codes)
+        else:
+            recorder.export_csv(args.record, engine.codes, labels)
+        recorder.close()
+        print(f"Wrote {len(recorder)} recorded step(s) to {args.record}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
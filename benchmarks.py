@@ -0,0 +1,291 @@
+"""Times parsing, model loading, propagation and rendering on the bundled pathways and on synthetic pathways
+
+Every benchmark is repeated and its best time kept, then run once more under tracemalloc to measure the peak
+memory it allocates through Python and NumPy. The results are written as JSON so runs of different versions can be
+compared with --compare.
+
+Example:
+    python benchmarks.py --sizes 1000 10000 100000 --output results.json
+    python benchmarks.py --output new.json --compare results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from kgml_generator import write_kgml
+from kgml_parser import parse_kgml
+
+# The pathways that ship with the project
+BUNDLED_KGML = ("kmgl_files/hsa04110.xml", "kmgl_files/hsa05215.xml", "kmgl_files/hsa05219.xml",
+                "kmgl_files/hsa05224.xml")
+
+# The synthetic pathway sizes benchmarked by default, in entries
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+# The shape of the synthetic pathways, relative to their number of entries
+RELATIONS_PER_ENTRY = 2
+ENTRIES_PER_GROUP = 50
+
+BENCHMARKS = ("parse", "load", "propagate", "render")
+
+
+def network_size(network):
+    """Returns the number of neurons and connections of a network"""
+    return len(network.neurons), sum(len(neuron.incoming_connections) for neuron in network.neurons.values())
+
+
+def measure(function, repeat):
+    """Times a function and measures the peak memory it allocates
+
+    Args:
+        function (function): the work to time, returning the number of work units it did
+        repeat (int): how many times to time it
+
+    Returns:
+        dict: the best and mean seconds, the units of work done and the peak traced memory in bytes
+    """
+    times = []
+    units = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        units = function()
+        times.append(time.perf_counter() - start)
+
+    # Trace one more run separately, since tracing slows allocation-heavy code down
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "mean_seconds": sum(times) / len(times), "units": units,
+            "peak_memory_bytes": peak}
+
+
+def bench_parse(kgml_path):
+    """Returns a function that parses a KGML file, counting its neurons"""
+    def run():
+        return len(parse_kgml(kgml_path).neurons)
+    return run
+
+
+def bench_load(network, model_path):
+    """Returns a function that applies a model file to a network, counting its genes and links"""
+    def run():
+        network.input_model_file(model_path)
+        return len(network.genes) + len(network.links)
+    return run
+
+
+def bench_propagate(network, steps):
+    """Returns a function that propagates a network step by step, counting the links it updated"""
+    def run():
+        network.compile()
+        for _ in range(steps):
+            network.propagate_net()
+        return len(network.links) * steps
+    return run
+
+
+class UncappedClock:
+    """Stands in for pygame.time.Clock so the frame loop is timed without its frame rate cap"""
+
+    def tick(self, framerate=0):
+        """Returns immediately"""
+        return 0
+
+
+def bench_render(network, frames, cold=False):
+    """Returns a function that draws a network headlessly for a number of full frames, counting them
+
+    The frame rate is measured between the first and the last redraw, leaving out the start-up of the window.
+    Unchanged frames only blit the cached connection arrows, cold frames draw them again every time, as after a
+    weight edit, a pan or a zoom.
+
+    Args:
+        network (NeuralNetwork): the network to draw
+        frames (int): the number of full frames to draw
+        cold (bool): redraw the connection arrows on every frame
+    """
+    def run():
+        # Import pygame only once rendering is benchmarked, with the dummy video driver so no window opens
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+        import pygame
+        import create_visual
+
+        updates = []
+        update = pygame.display.update
+        clock = pygame.time.Clock
+        viewport_key = create_visual.Viewport.key
+
+        def timed_update(*args):
+            # Ask for the next full redraw after every frame, then close the window
+            update(*args)
+            updates.append(time.perf_counter())
+            pygame.event.post(pygame.event.Event(pygame.VIDEOEXPOSE if len(updates) < frames else pygame.QUIT))
+
+        pygame.display.update = timed_update
+        pygame.time.Clock = UncappedClock
+        if cold:
+            # A viewport key that never repeats makes every frame render the arrow layer again
+            create_visual.Viewport.key = lambda viewport: len(updates)
+        try:
+            create_visual.visualize_network(network, "")
+        finally:
+            pygame.display.update = update
+            pygame.time.Clock = clock
+            create_visual.Viewport.key = viewport_key
+        # Keep the fastest frame rate, which leaves out the run slowed down by tracemalloc
+        frame_seconds = (updates[-1] - updates[0]) / max(len(updates) - 1, 1)
+        run.frame_seconds = min(frame_seconds, getattr(run, "frame_seconds", frame_seconds))
+        return len(updates)
+    return run
+
+
+def run_case(name, label, network, function, repeat, unit, results):
+    """Measures one benchmark of one network and adds its result
+
+    Args:
+        name (str): the benchmark
+        label (str): the network it runs on
+        network (NeuralNetwork): the network, for its size
+        function (function): the work to time, see measure
+        repeat (int): how many times to time it
+        unit (str): what the work units of the function are
+        results (list): the results to add to
+    """
+    nodes, edges = network_size(network)
+    result = {"benchmark": name, "input": label, "nodes": nodes, "edges": edges}
+    result.update(measure(function, repeat))
+    if hasattr(function, "frame_seconds"):
+        # Rendering is timed per frame, so window start-up does not count against the frame rate
+        result["seconds"] = function.frame_seconds
+        result["throughput"] = 1 / function.frame_seconds if function.frame_seconds else 0.0
+    else:
+        result["throughput"] = result["units"] / result["seconds"] if result["seconds"] else 0.0
+    result["unit"] = unit
+    results.append(result)
+    print(f"{name:12} {label:20} {nodes:>9} nodes  {result['seconds'] * 1000:10.2f} ms  "
+          f"{result['throughput']:14.1f} {unit}  {result['peak_memory_bytes'] / 2 ** 20:9.1f} MiB", flush=True)
+
+
+def bench_pathway(label, kgml_path, args, results):
+    """Runs every benchmark on one KGML file
+
+    Args:
+        label (str): the name of the pathway in the results
+        kgml_path (str): the KGML file
+        args (argparse.Namespace): the parsed arguments
+        results (list): the results to add to
+    """
+    network = parse_kgml(kgml_path)
+    if "parse" in args.benchmarks:
+        run_case("parse", label, network, bench_parse(kgml_path), args.repeat, "neurons/s", results)
+
+    network.setup("")
+    if "load" in args.benchmarks:
+        with tempfile.TemporaryDirectory() as directory:
+            for extension in (".txt", ".m3b"):
+                model_path = os.path.join(directory, "model" + extension)
+                network.generate_model_file(model_path)
+                run_case("load" + extension, label, network, bench_load(network, model_path), args.repeat,
+                         "lines/s", results)
+    if "propagate" in args.benchmarks:
+        run_case("propagate", label, network, bench_propagate(network, args.steps), args.repeat, "links/s",
+                 results)
+    if "render" in args.benchmarks and len(network.neurons) <= args.render_limit:
+        run_case("render", label, network, bench_render(network, args.frames), args.repeat, "frames/s", results)
+        run_case("render.cold", label, network, bench_render(network, args.frames, cold=True), args.repeat,
+                 "frames/s", results)
+
+
+def compare(results, baseline_path):
+    """Prints how the throughput of every benchmark changed since a saved run
+
+    Args:
+        results (list): the results of this run
+        baseline_path (str): a JSON file written by an earlier run
+    """
+    with open(baseline_path, encoding="utf8") as file:
+        baseline = {(result["benchmark"], result["input"]): result for result in json.load(file)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        old = baseline.get((result["benchmark"], result["input"]))
+        if old is None or not old["throughput"]:
+            continue
+        ratio = result["throughput"] / old["throughput"]
+        memory = result["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1)
+        print(f"{result['benchmark']:12} {result['input']:20} {ratio:6.2f}x throughput  {memory:6.2f}x peak memory")
+
+
+def parse_args(argv):
+    """Reads the command line arguments
+
+    Args:
+        argv (list): the arguments after the program name
+    """
+    parser = argparse.ArgumentParser(description="Benchmark parsing, model loading, propagation and rendering")
+    parser.add_argument("--benchmarks", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS),
+                        help="the benchmarks to run")
+    parser.add_argument("--sizes", nargs="*", type=int, default=list(DEFAULT_SIZES),
+                        help="the entry counts of the synthetic pathways (none to only use the bundled pathways)")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the synthetic pathways")
+    parser.add_argument("--no-bundled", action="store_true", help="skip the bundled pathways")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times every benchmark is timed")
+    parser.add_argument("--steps", type=int, default=10, help="the number of steps every propagation takes")
+    parser.add_argument("--frames", type=int, default=20, help="the number of full redraws every render draws")
+    parser.add_argument("--render-limit", type=int, default=200000,
+                        help="skip rendering networks with more nodes than this")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="a JSON file of an earlier run to compare the results with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the benchmarks described by the command line"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    # The bundled paths and the font of the visualizer are relative to the project directory
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+
+    if not args.no_bundled:
+        for kgml_path in BUNDLED_KGML:
+            bench_pathway(os.path.splitext(os.path.basename(kgml_path))[0], kgml_path, args, results)
+
+    # Generate every synthetic pathway just before it is benchmarked, so only one is on disk at a time
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            kgml_path = os.path.join(directory, "synthetic-" + str(size) + ".xml")
+            write_kgml(kgml_path, entries=size, groups=size // ENTRIES_PER_GROUP,
+                       relations=size * RELATIONS_PER_ENTRY, seed=args.seed)
+            bench_pathway("synthetic-" + str(size), kgml_path, args, results)
+            os.remove(kgml_path)
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote {len(results)} result(s) to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
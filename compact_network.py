@@ -0,0 +1,466 @@
+"""Holds a neural network in shared arrays, with thin views standing in for Neuron and Connection objects"""
+from collections.abc import ItemsView, Mapping, ValuesView
+
+import numpy as np
+
+from activations import DEFAULT_ACTIVATION, get_activation
+from model_format import BinaryModel, match_model
+from networking import NO_CODE, NeuralNetwork, Neuron, gene_key, warn_weight_conflicts
+
+
+def first_appearance(keys):
+    """Numbers the distinct keys of an array in the order they first appear
+
+    Args:
+        keys (np.ndarray): the keys to number
+
+    Returns:
+        tuple: the number of every key, then the position of the first appearance of every number
+    """
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.size)
+    return rank[inverse.reshape(-1)].astype(np.intp), first[order]
+
+
+class CompactNetwork(NeuralNetwork):
+    """Stores every entry, gene and edge of a network in arrays indexed by integer node id
+
+    Entries point at canonical gene rows (one per code) that hold values, biases and decays, edges are parallel
+    source/target arrays, and their weights live in one row per pair of codes, exactly as share_parameters lays
+    out a NeuralNetwork. NeuronView and ConnectionView provide the Neuron and Connection attribute API on top of
+    the arrays, and CompiledNetwork propagates the gene arrays in place without copying them.
+    """
+
+    def __init__(self, arrays):
+        # Genes and links are derived from the arrays, so the object tables of NeuralNetwork are not set up
+        self.engine = None
+        self.edited_codes = set()
+        self.weight_conflicts = {}
+
+        # Per-entry columns
+        self.ids = np.asarray(arrays["ids"], dtype=str)
+        self.names = np.asarray(arrays["names"], dtype=str)
+        self.types = np.asarray(arrays["types"], dtype=str)
+        self.codes = np.asarray(arrays["codes"], dtype=str)
+        self.positions = np.asarray(arrays["positions"], dtype=np.int64).reshape(-1, 2)
+        self.is_inputs = np.zeros(self.ids.size, dtype=bool)
+        self._id_index = None
+
+        # One gene row per code, taking the parameters of the first entry of the code (see gene_key)
+        keys = np.where(self.codes == NO_CODE, np.char.add(NO_CODE + ":", self.ids), self.codes)
+        self.gene_of, first_entries = first_appearance(keys)
+        self.gene_codes = keys[first_entries]
+        self.values = np.array(arrays["values"], dtype=np.float64)[first_entries]
+        self.biases = np.array(arrays["biases"], dtype=np.float64)[first_entries]
+        self.decays = np.array(arrays["decays"], dtype=np.float64)[first_entries]
+        self.activations = np.full(self.gene_codes.size, DEFAULT_ACTIVATION, dtype=object)
+
+        # Entry-level edges and one link row per pair of codes, taking the weight of the first edge of the pair
+        self.edge_sources = np.asarray(arrays["edge_sources"], dtype=np.intp)
+        self.edge_targets = np.asarray(arrays["edge_targets"], dtype=np.intp)
+        self._index_links(np.asarray(arrays["edge_weights"], dtype=np.float64))
+
+        # Group membership by entry index
+        self.group_rows = np.asarray(arrays["group_rows"], dtype=np.intp)
+        self.component_rows = np.asarray(arrays["component_rows"], dtype=np.intp)
+        self.group_components = {}
+        for group_row, component_row in zip(self.group_rows.tolist(), self.component_rows.tolist()):
+            self.group_components.setdefault(str(self.ids[group_row]), []).append(str(self.ids[component_row]))
+
+    def _index_links(self, edge_weights):
+        """Builds the link rows of the edges from their per-edge weights"""
+        num_genes = max(self.gene_codes.size, 1)
+        pair_keys = self.gene_of[self.edge_sources].astype(np.int64) * num_genes + self.gene_of[self.edge_targets]
+        self.edge_links, first_edges = first_appearance(pair_keys)
+        self.link_sources = self.gene_of[self.edge_sources[first_edges]]
+        self.link_targets = self.gene_of[self.edge_targets[first_edges]]
+        self.link_weights = edge_weights[first_edges]
+
+        # Record and warn about the pairs whose edges were given different weights, as NeuralNetwork does
+        conflicts = {}
+        for edge in np.flatnonzero(edge_weights != self.link_weights[self.edge_links]).tolist():
+            link = self.edge_links[edge]
+            pair = (str(self.gene_codes[self.link_sources[link]]), str(self.gene_codes[self.link_targets[link]]))
+            weights = conflicts.setdefault(pair, [float(self.link_weights[link])])
+            if edge_weights[edge] not in weights:
+                weights.append(float(edge_weights[edge]))
+        self.weight_conflicts.update(conflicts)
+        warn_weight_conflicts(conflicts)
+        self._incoming = None
+        self._outgoing = None
+
+    @staticmethod
+    def _adjacency(ends, size):
+        """Returns CSR-style (pointers, edge indices) grouping the edges by one of their ends"""
+        order = np.argsort(ends, kind="stable")
+        pointers = np.zeros(size + 1, dtype=np.intp)
+        np.cumsum(np.bincount(ends, minlength=size), out=pointers[1:])
+        return pointers, order
+
+    def incoming_edges(self, index):
+        """Returns the indices of the edges ending at an entry, in the order they were added"""
+        if self._incoming is None:
+            self._incoming = self._adjacency(self.edge_targets, self.ids.size)
+        pointers, order = self._incoming
+        return order[pointers[index]:pointers[index + 1]].tolist()
+
+    def outgoing_edges(self, index):
+        """Returns the indices of the edges starting at an entry, in the order they were added"""
+        if self._outgoing is None:
+            self._outgoing = self._adjacency(self.edge_sources, self.ids.size)
+        pointers, order = self._outgoing
+        return order[pointers[index]:pointers[index + 1]].tolist()
+
+    def index_of(self, id_):
+        """Returns the entry index of a neuron id"""
+        if self._id_index is None:
+            self._id_index = {id_: index for index, id_ in enumerate(self.ids.tolist())}
+        return self._id_index[id_]
+
+    def add_edge(self, source, target, weight):
+        """Connects two entries, sharing the weight of their pair of codes if it is already linked
+
+        Appending copies the edge arrays, so build large networks as a NeuralNetwork and pack them instead.
+        """
+        edge_weights = self.link_weights[self.edge_links]
+        self.edge_sources = np.append(self.edge_sources, source)
+        self.edge_targets = np.append(self.edge_targets, target)
+        self._index_links(np.append(edge_weights, float(weight)))
+        self.invalidate()
+
+    @property
+    def neurons(self):
+        """A read-only mapping of neuron ids to NeuronViews"""
+        return NeuronMap(self)
+
+    @property
+    def genes(self):
+        """A mapping of every code to a view of its canonical parameters"""
+        return {str(code): GeneView(self, row) for row, code in enumerate(self.gene_codes.tolist())}
+
+    @property
+    def links(self):
+        """A mapping of every (source code, target code) pair to a view of its shared weight"""
+        return {(str(self.gene_codes[source]), str(self.gene_codes[target])): LinkView(self, link)
+                for link, (source, target) in enumerate(zip(self.link_sources.tolist(),
+                                                            self.link_targets.tolist()))}
+
+    def share_parameters(self):
+        """Entries already share their gene rows, so there is nothing to do"""
+
+    def pack(self):
+        """Hands CompiledNetwork the gene arrays themselves so propagation updates them in place"""
+        return {
+            "ids": self.ids.tolist(),
+            "rows": self.gene_of,
+            "codes": self.gene_codes.tolist(),
+            "values": self.values,
+            "biases": self.biases,
+            "decays": self.decays,
+            "link_sources": self.link_sources,
+            "link_targets": self.link_targets,
+            "link_weights": self.link_weights,
+            "activations": self.activations.tolist(),
+        }
+
+    def read_parameters(self, values, biases, decays):
+        """Copies the gene arrays unless they are the arrays being filled"""
+        for source, destination in ((self.values, values), (self.biases, biases), (self.decays, decays)):
+            if destination is not source:
+                destination[:] = source
+
+    def write_values(self, values):
+        """Copies values into the gene array unless they already are the gene array"""
+        if values is not self.values:
+            self.values[:] = values
+
+    def read_codes(self, codes, rows, values, biases, decays):
+        """Copies some gene rows unless they are the arrays being filled"""
+        for source, destination in ((self.values, values), (self.biases, biases), (self.decays, decays)):
+            if destination is not source:
+                destination[rows] = source[rows]
+
+    def write_codes(self, codes, rows, values):
+        """Copies some rows of values into the gene array unless they already are the gene array"""
+        if values is not self.values:
+            self.values[rows] = values[rows]
+
+    def _input_binary_model(self, model_path):
+        """Writes a binary model file straight into the gene and link arrays, returning the entries that matched
+        nothing"""
+        model = BinaryModel(model_path)
+        code_rows, edge_links, unmatched = match_model(model, self.gene_codes, self.link_sources, self.link_targets)
+
+        matched = code_rows >= 0
+        self.values[code_rows[matched]] = model.values[matched]
+        self.biases[code_rows[matched]] = model.biases[matched]
+        self.decays[code_rows[matched]] = model.decays[matched]
+        matched = edge_links >= 0
+        self.link_weights[edge_links[matched]] = model.edge_weights[matched]
+        return unmatched
+
+    def to_arrays(self):
+        """Unpacks the gene and link rows back onto every entry and edge"""
+        return {
+            "ids": self.ids,
+            "names": self.names,
+            "types": self.types,
+            "codes": self.codes,
+            "positions": self.positions,
+            "values": self.values[self.gene_of],
+            "biases": self.biases[self.gene_of],
+            "decays": self.decays[self.gene_of],
+            "edge_sources": self.edge_sources,
+            "edge_targets": self.edge_targets,
+            "edge_weights": self.link_weights[self.edge_links],
+            "group_rows": self.group_rows,
+            "component_rows": self.component_rows,
+        }
+
+
+class NeuronMap(Mapping):
+    """Maps neuron ids to NeuronViews of a CompactNetwork, creating the views on demand"""
+
+    def __init__(self, network):
+        self.network = network
+
+    def __getitem__(self, id_):
+        return NeuronView(self.network, self.network.index_of(id_))
+
+    def __iter__(self):
+        return iter(self.network.ids.tolist())
+
+    def __len__(self):
+        return self.network.ids.size
+
+    def __contains__(self, id_):
+        try:
+            self.network.index_of(id_)
+        except KeyError:
+            return False
+        return True
+
+    def values(self):
+        return NeuronValues(self)
+
+    def items(self):
+        return NeuronItems(self)
+
+
+class NeuronValues(ValuesView):
+    """Iterates the NeuronViews of a CompactNetwork by entry index, without looking ids up"""
+
+    def __iter__(self):
+        network = self._mapping.network
+        return (NeuronView(network, index) for index in range(network.ids.size))
+
+
+class NeuronItems(ItemsView):
+    """Iterates the (id, NeuronView) pairs of a CompactNetwork by entry index, without looking ids up"""
+
+    def __iter__(self):
+        network = self._mapping.network
+        return ((id_, NeuronView(network, index)) for index, id_ in enumerate(network.ids.tolist()))
+
+
+class NeuronView:
+    """Presents one entry of a CompactNetwork with the attribute API of Neuron"""
+
+    __slots__ = ("network", "index")
+    activation_function = Neuron.activation_function
+
+    def __init__(self, network, index):
+        self.network = network
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, NeuronView) and other.network is self.network and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.network), self.index))
+
+    @property
+    def id_(self):
+        """The id of the entry"""
+        return str(self.network.ids[self.index])
+
+    @property
+    def name(self):
+        """The name of the entry"""
+        return str(self.network.names[self.index])
+
+    @property
+    def type(self):
+        """The KGML type of the entry"""
+        return str(self.network.types[self.index])
+
+    @property
+    def code(self):
+        """The code of the entry"""
+        return str(self.network.codes[self.index])
+
+    @property
+    def key(self):
+        """The key of the entry's gene row, its code unless it has none (see gene_key)"""
+        return gene_key(self.id_, self.code)
+
+    @property
+    def pos(self):
+        """The coordinates of the entry (correlates with KGML file)"""
+        x, y = self.network.positions[self.index].tolist()
+        return x, y
+
+    @property
+    def is_input(self):
+        """Whether the entry is held constant as an input"""
+        return bool(self.network.is_inputs[self.index])
+
+    @is_input.setter
+    def is_input(self, is_input):
+        self.network.is_inputs[self.index] = is_input
+
+    @property
+    def value(self):
+        """The current value of the entry's code"""
+        return float(self.network.values[self.network.gene_of[self.index]])
+
+    @value.setter
+    def value(self, value):
+        self.network.values[self.network.gene_of[self.index]] = value
+
+    @property
+    def activation_type(self):
+        """The name of the activation function of the entry's code"""
+        return self.network.activations[self.network.gene_of[self.index]]
+
+    @activation_type.setter
+    def activation_type(self, name):
+        self.network.activations[self.network.gene_of[self.index]] = get_activation(name).name
+
+    @property
+    def bias(self):
+        """The bias of the entry's code"""
+        return float(self.network.biases[self.network.gene_of[self.index]])
+
+    @bias.setter
+    def bias(self, bias):
+        self.network.biases[self.network.gene_of[self.index]] = bias
+
+    @property
+    def decay(self):
+        """The decay of the entry's code"""
+        return float(self.network.decays[self.network.gene_of[self.index]])
+
+    @decay.setter
+    def decay(self, decay):
+        self.network.decays[self.network.gene_of[self.index]] = decay
+
+    @property
+    def incoming_connections(self):
+        """The connections ending at the entry"""
+        return [ConnectionView(self.network, edge) for edge in self.network.incoming_edges(self.index)]
+
+    @property
+    def outgoing_connections(self):
+        """The connections starting at the entry"""
+        return [ConnectionView(self.network, edge) for edge in self.network.outgoing_edges(self.index)]
+
+    def connect(self, target_neuron, weight):
+        """Connects the entry with another entry of the same network"""
+        self.network.add_edge(self.index, target_neuron.index, weight)
+
+
+class ConnectionView:
+    """Presents one edge of a CompactNetwork with the attribute API of Connection"""
+
+    __slots__ = ("network", "index")
+
+    def __init__(self, network, index):
+        self.network = network
+        self.index = index
+
+    @property
+    def source(self):
+        """The entry the edge starts at"""
+        return NeuronView(self.network, int(self.network.edge_sources[self.index]))
+
+    @property
+    def target(self):
+        """The entry the edge ends at"""
+        return NeuronView(self.network, int(self.network.edge_targets[self.index]))
+
+    @property
+    def weight(self):
+        """The weight shared by every edge between the same pair of codes"""
+        return float(self.network.link_weights[self.network.edge_links[self.index]])
+
+    @weight.setter
+    def weight(self, weight):
+        self.network.link_weights[self.network.edge_links[self.index]] = weight
+
+
+class GeneView:
+    """Presents one gene row of a CompactNetwork with the attribute API of GeneParameters"""
+
+    __slots__ = ("network", "row")
+
+    def __init__(self, network, row):
+        self.network = network
+        self.row = row
+
+    @property
+    def value(self):
+        """The current value of the gene"""
+        return float(self.network.values[self.row])
+
+    @value.setter
+    def value(self, value):
+        self.network.values[self.row] = value
+
+    @property
+    def bias(self):
+        """The bias of the gene"""
+        return float(self.network.biases[self.row])
+
+    @bias.setter
+    def bias(self, bias):
+        self.network.biases[self.row] = bias
+
+    @property
+    def decay(self):
+        """The decay of the gene"""
+        return float(self.network.decays[self.row])
+
+    @decay.setter
+    def decay(self, decay):
+        self.network.decays[self.row] = decay
+
+    @property
+    def activation(self):
+        """The name of the activation function of the gene"""
+        return self.network.activations[self.row]
+
+    @activation.setter
+    def activation(self, name):
+        self.network.activations[self.row] = get_activation(name).name
+
+
+class LinkView:
+    """Presents one link row of a CompactNetwork with the attribute API of SharedWeight"""
+
+    __slots__ = ("network", "row")
+
+    def __init__(self, network, row):
+        self.network = network
+        self.row = row
+
+    @property
+    def weight(self):
+        """The weight of the pair of codes"""
+        return float(self.network.link_weights[self.row])
+
+    @weight.setter
+    def weight(self, weight):
+        self.network.link_weights[self.row] = weight
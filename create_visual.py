@@ -1,104 +1,19 @@
 """Takes in a KGML file and creates an interactive visual representation of it"""
-import xml.etree.ElementTree as ET
-import pygame
-from networking import NeuralNetwork, Neuron
-
+from collections import OrderedDict
 
-def parse_kgml(file_path):
-    """Takes in a KGML file, returns a neural network
+import numpy as np
+import pygame
+from pathway_cache import PathwayCache
+from simulation_runner import BackgroundSimulation
+from spatial_index import build_neuron_grid
+from trajectory import TrajectoryRecorder
 
-    Args:
-        file_path (str): the filepath
-    """
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    neural_net = NeuralNetwork()
-
-    # Iterate over all non-group entries of KGML
-    for entry in root.iter("entry"):
-        if entry.attrib["type"] == "group":
-            continue
-
-        id_ = entry.attrib["id"]
-        name = entry.attrib["name"].split(",")[0].split(".")[0]
-        type_ = entry.attrib["type"]
-
-        # Ignore irrelevant entries
-        if type_ == "map":
-            continue
-
-        # Input the coordinates of the Entry (correlates with KGML file)
-        pos = (0, 0)
-        graphics_name = "n/a"
-        for graphics in entry.iter("graphics"):
-            if "name" in graphics.attrib:
-                graphics_name = graphics.attrib["name"].split(",")[0].split(".")[0]
-            pos = (int(graphics.attrib["x"]), int(graphics.attrib["y"]))
-
-        # Create a neuron to represent the Entry
-        neuron = Neuron(id_, name, type_, pos, graphics_name)
-        neural_net.neurons[id_] = neuron
-
-    # Iterate over all groups in KGML
-    counter = 0
-    for group in root.iter("entry"):
-        if group.attrib["type"] != "group":
-            continue
-
-        # Input the coordinates of the Entry (correlates with KGML file)
-        pos = (0, 0)
-        for graphics in group.iter("graphics"):
-            pos = (int(graphics.attrib["x"]), int(graphics.attrib["y"]))
-
-        # Create a neuron to represent the group
-        counter += 1
-        group_neuron = Neuron(group.attrib["id"],
-                              group.attrib["name"] + str(counter),
-                              "group",
-                              pos,
-                              "Group" + str(counter))
-        neural_net.neurons[group.attrib["id"]] = group_neuron
-
-        # Connect the components of the group to the group
-        num_comps = 0
-        for _ in group.iter("component"):
-            num_comps += 1
-
-        for component in group.iter("component"):
-            component_id = component.attrib["id"]
-            component_neuron = neural_net.neurons[component_id]
-
-            component_neuron.connect(group_neuron, 1/num_comps)
-
-    # Iterate over all the relations in the KGML
-    for relation in root.iter("relation"):
-        # Determine the two entries that are being interacted with
-        source_id = relation.attrib["entry1"]
-        target_id = relation.attrib["entry2"]
-        source_neuron = neural_net.neurons[source_id]
-        target_neuron = neural_net.neurons[target_id]
-
-        # Iterate over all the subtypes. (THIS CAN/SHOULD BE UPDATED AS WE GAIN MORE KNOWLEDGE OF EFFECTS)
-        count = 0
-        for subtype in relation.iter("subtype"):
-            count += 1
-
-            if count == 2:
-                break
-            type_ = subtype.attrib["name"]
-
-            if type_ in ["activation", "expression", "binding/association", "indirect effect", "missing interaction",
-                         "phosphorylation"]:
-                # Define positive relations
-                source_neuron.connect(target_neuron, 1)
-            elif type_ in ["inhibition", "repression", "dissociation", "methylation", "dephosphorylation"]:
-                # Define negative relations
-                source_neuron.connect(target_neuron, -1)
-            else:
-                # All other types of relationships
-                pass
+# Window events after which the whole screen has to be redrawn
+WINDOW_EVENTS = (pygame.VIDEORESIZE, pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWSIZECHANGED,
+                 pygame.WINDOWRESTORED, pygame.WINDOWSHOWN)
 
-    return neural_net
+# Posted by the simulation thread when a new step is ready to be drawn
+SIMULATION_EVENT = pygame.event.custom_type()
 
 
 # Credit to u/plastic_astronomer for draw_arrow function
@@ -159,6 +74,194 @@ def draw_arrow(
         pygame.draw.polygon(surface, color, body_vertices)
 
 
+class TextCache:
+    """Keeps the most recently rendered text surfaces of a font, so unchanged panel text is not rendered again"""
+
+    def __init__(self, font, max_entries=512):
+        self.font = font
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+
+    def render(self, text, color):
+        """Returns the surface of a text in a color, rendering it only if it is not cached
+
+        Args:
+            text (str): the text to render
+            color (tuple): the RGB color of the text
+        """
+        key = (text, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.font.render(text, False, color)
+            self.surfaces[key] = surface
+
+            # Forget the least recently used text once the cache is full
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+
+class Viewport:
+    """Maps KGML coordinates onto the screen, with a zoom factor and a pan offset on top of the base layout"""
+
+    def __init__(self, base_scale, left, min_zoom=0.05, max_zoom=8.0):
+        self.base_scale = base_scale
+        self.left = left
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.zoom = 1.0
+        self.pan_x = 0.0
+        self.pan_y = 0.0
+
+    @property
+    def scale(self):
+        """The number of screen pixels per KGML unit"""
+        return self.base_scale * self.zoom
+
+    def to_screen(self, x, y):
+        """Returns the screen position of a KGML position"""
+        return self.scale * x + self.left + self.pan_x, self.scale * y + self.pan_y
+
+    def to_world(self, s_x, s_y):
+        """Returns the KGML position under a screen position"""
+        return (s_x - self.left - self.pan_x) / self.scale, (s_y - self.pan_y) / self.scale
+
+    def world_rect(self, rect):
+        """Returns the (left, top, right, bottom) KGML bounds of a screen rectangle"""
+        left, top = self.to_world(rect.left, rect.top)
+        right, bottom = self.to_world(rect.right, rect.bottom)
+        return left, top, right, bottom
+
+    def pan(self, d_x, d_y):
+        """Moves the view by a number of screen pixels"""
+        self.pan_x += d_x
+        self.pan_y += d_y
+
+    def zoom_at(self, s_x, s_y, factor):
+        """Zooms by a factor while keeping the KGML position under a screen position in place"""
+        w_x, w_y = self.to_world(s_x, s_y)
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), self.max_zoom)
+        self.pan_x = s_x - self.scale * w_x - self.left
+        self.pan_y = s_y - self.scale * w_y
+
+    def reset(self):
+        """Returns to the original layout"""
+        self.zoom = 1.0
+        self.pan_x = 0.0
+        self.pan_y = 0.0
+
+    def key(self):
+        """Returns a value that changes whenever the mapping does"""
+        return self.zoom, self.pan_x, self.pan_y
+
+
+def collapsed_positions(network):
+    """Returns the position of the group that every group component is drawn at when groups are collapsed
+
+    Args:
+        network (NeuralNetwork): the network whose group_components are collapsed
+    """
+    positions = {}
+    for group_id, component_ids in network.group_components.items():
+        if group_id in network.neurons:
+            group_pos = network.neurons[group_id].pos
+            for component_id in component_ids:
+                positions.setdefault(component_id, group_pos)
+    return positions
+
+
+def edge_table(neurons, moved=None):
+    """Lists every connection in draw order as a (connections x 5) array of source x, source y, target x, target y
+    and weight in KGML coordinates
+
+    Args:
+        neurons (iterable): the neurons whose outgoing connections are listed
+        moved (dict): positions to draw some neurons at instead of their own, by neuron id
+    """
+    moved = moved or {}
+    rows = []
+    for neuron in neurons:
+        n_x, n_y = moved.get(neuron.id_, neuron.pos)
+        for connection in neuron.outgoing_connections:
+            t_x, t_y = moved.get(connection.target.id_, connection.target.pos)
+            rows.append((n_x, n_y, t_x, t_y, connection.weight))
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def render_edge_layer(edges, size, viewport, view_rect, low_detail):
+    """Draws the connections inside a screen rectangle onto a white off-screen surface, so a frame only has to blit it
+
+    Args:
+        edges (np.ndarray): the connections, as returned by edge_table
+        size (tuple): the size of the screen
+        viewport (Viewport): the mapping from KGML coordinates onto the screen
+        view_rect (pygame.Rect): the part of the screen that shows the pathway
+        low_detail (bool): draw connections between nearby neurons as one line without arrowheads
+    """
+    layer = pygame.Surface(size).convert()
+    layer.fill((255, 255, 255))
+
+    # Move the connections onto the screen and skip the ones that cannot reach the visible rectangle
+    scale = viewport.scale
+    starts_x = scale * edges[:, 0] + viewport.left + viewport.pan_x
+    starts_y = scale * edges[:, 1] + viewport.pan_y
+    ends_x = scale * edges[:, 2] + viewport.left + viewport.pan_x
+    ends_y = scale * edges[:, 3] + viewport.pan_y
+    weights = edges[:, 4]
+    margin = 16 + 2 * np.abs(weights)
+    visible = ((np.maximum(starts_x, ends_x) + margin >= view_rect.left)
+               & (np.minimum(starts_x, ends_x) - margin <= view_rect.right)
+               & (np.maximum(starts_y, ends_y) + margin >= view_rect.top)
+               & (np.minimum(starts_y, ends_y) - margin <= view_rect.bottom))
+
+    if low_detail:
+        # Drop connections that collapsed into a single point
+        visible &= (starts_x != ends_x) | (starts_y != ends_y)
+        points = np.column_stack((starts_x, starts_y, ends_x, ends_y))[visible]
+        if points.size == 0:
+            return layer
+
+        # Merge the connections whose ends fall into the same pair of small screen cells into one line
+        cells = np.floor(points / 6).astype(np.int64)
+        _, merged = np.unique(cells, axis=0, return_inverse=True)
+        merged = merged.ravel()
+        counts = np.bincount(merged)
+        totals = np.bincount(merged, weights=weights[visible])
+        means = [np.bincount(merged, weights=points[:, column]) / counts for column in range(4)]
+        for s_x, s_y, e_x, e_y, total in zip(*means, totals):
+            pygame.draw.line(layer,
+                             pygame.Color("red") if total <= 0 else pygame.Color("lightblue"),
+                             (s_x, s_y),
+                             (e_x, e_y),
+                             max(1, min(int(2 * abs(total) * viewport.zoom), 8)))
+        return layer
+
+    # Draw pathway
+    for index in np.flatnonzero(visible).tolist():
+        weight = float(weights[index])
+        if weight <= 0:
+            # Draw negative connection
+            draw_arrow(layer,
+                       pygame.Vector2(float(starts_x[index]), float(starts_y[index])),
+                       pygame.Vector2(float(ends_x[index]), float(ends_y[index])),
+                       pygame.Color("red"),
+                       2 * abs(weight) * viewport.zoom,
+                       16,
+                       8)
+        else:
+            # Draw positive connection
+            draw_arrow(layer,
+                       pygame.Vector2(float(starts_x[index]), float(starts_y[index])),
+                       pygame.Vector2(float(ends_x[index]), float(ends_y[index])),
+                       pygame.Color("lightblue"),
+                       2 * abs(weight) * viewport.zoom,
+                       16,
+                       8)
+    return layer
+
+
 def visualize_network(network, model_path):
     """Takes in a Neural Network and generates an interactive, visual Neural Network
 
@@ -173,10 +276,16 @@ def visualize_network(network, model_path):
     right_shift = 200
     offset_increment = 110
     num_decimals = 5
+    zoom_step = 1.25
+    low_detail_zoom = 0.5
+    min_steps_per_second = 0.5
+    max_steps_per_second = 1000
+    recorded_steps = 1000
     pygame.display.set_caption("KGML Model Creator")
     font = pygame.font.Font("Tinos-Bold.ttf", 18)
     screen = pygame.display.set_mode((1000 + right_shift, 700),
                                      pygame.RESIZABLE)
+    text_cache = TextCache(font)
     edit = font.render("Edit",
                        False,
                        pygame.Color("purple"))
@@ -191,75 +300,130 @@ def visualize_network(network, model_path):
     typing_item = None
     typing_string = ""
     typing_ind = -1
+    panel_scroll = 0
     running = True
 
+    # Index the neurons by position so clicks, hovering, box selection and culling only look at nearby neurons,
+    # with a second index that leaves out group components for when groups are collapsed
+    viewport = Viewport(graph_scale, right_shift)
+    collapsed = collapsed_positions(network)
+    neuron_grid = build_neuron_grid(neurons)
+    collapsed_grid = build_neuron_grid(neuron for neuron in neurons if neuron.id_ not in collapsed)
+    pan_start = None
+    hovered_neuron = None
+    selected_neurons = set()
+    drag_start = None
+    drag_end = None
+
+    # Propagate in a background thread that wakes the loop up whenever a new step is ready, recording the latest
+    # steps so they can be played back
+    network.share_parameters()
+    recorder = TrajectoryRecorder(len(network.genes), recorded_steps)
+    simulation = BackgroundSimulation(network,
+                                      on_snapshot=lambda: pygame.event.post(pygame.event.Event(SIMULATION_EVENT)),
+                                      recorder=recorder)
+    simulation.start()
+    scrub_index = None
+
+    # The screen is only redrawn when something changes, and at most max_frame_rate times a second
+    clock = pygame.time.Clock()
+    max_frame_rate = 30
+    redraw_panel = True
+    redraw_graph = True
+    edge_layer = None
+    edge_layer_key = None
+    edge_tables = {}
+
     # Start the game loop
     while running:
         # Reset Screen
         offset = 75
 
-        screen.fill((255, 255, 255))
-        _, screen_height = pygame.display.get_surface().get_size()
-        pygame.draw.rect(screen,
-                         pygame.Color("grey"),
-                         pygame.Rect(0, 0, right_shift, screen_height))
+        # Sleep until the next event instead of redrawing an unchanged screen
+        events = pygame.event.get()
+        if not events and not (redraw_panel or redraw_graph):
+            events = [pygame.event.wait()] + pygame.event.get()
 
         # Test for Pygame events
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 # If the tab is quit, exit the loop
                 running = False
                 break
+            elif event.type in WINDOW_EVENTS:
+                # Redraw everything once the window is resized or uncovered
+                redraw_panel = True
+                redraw_graph = True
             elif event.type == pygame.KEYDOWN:
+                # Every key changes either the typed string or the values shown in the panel
+                redraw_panel = True
+
+                # Go back to the live values before stepping or editing the network
+                if scrub_index is not None and (event.key in (pygame.K_SPACE, pygame.K_END, pygame.K_RETURN)
+                                                or event.key == pygame.K_p and not is_typing):
+                    scrub_index = None
+                    simulation.apply_latest(force=True)
+                    redraw_graph = True
+
                 if event.key == pygame.K_SPACE:
-                    # Propagate the network when space-bar is pressed
-                    network.propagate_net()
+                    # Propagate the network by one step when space-bar is pressed
+                    simulation.request_steps(1)
+                elif event.key == pygame.K_p and not is_typing:
+                    # Play or pause continuous propagation
+                    if simulation.is_playing:
+                        simulation.pause()
+                    else:
+                        simulation.play()
+                elif event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS) and not is_typing:
+                    # Double the step rate
+                    simulation.set_rate(min(simulation.steps_per_second * 2, max_steps_per_second))
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS) and not is_typing:
+                    # Halve the step rate
+                    simulation.set_rate(max(simulation.steps_per_second / 2, min_steps_per_second))
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT) and not is_typing and len(recorder) > 1:
+                    # Scrub through the recorded steps, pausing the simulation while looking back
+                    if scrub_index is None:
+                        simulation.pause()
+                        scrub_index = len(recorder) - 1
+                    scrub_index += -1 if event.key == pygame.K_LEFT else 1
+                    scrub_index = min(max(scrub_index, 0), len(recorder) - 1)
+                    if scrub_index == len(recorder) - 1:
+                        # Stepping past the newest recorded step returns to the live values
+                        scrub_index = None
+                        simulation.apply_latest(force=True)
+                    else:
+                        network.write_values(recorder.frame(scrub_index)[1])
+                    redraw_graph = True
                 elif event.key == pygame.K_RETURN:
                     if is_typing:
+                        # The neuron colors or arrow widths may change with the typed value
+                        redraw_graph = True
                         # Change network values to typed strings
                         try:
+                            # Every entry of a code shares its parameters, so one assignment updates them all
                             if typing_item in ("value", "inc_value"):
-                                # Change neuron values
-                                if float(typing_string) > 1:
-                                    # Set the value to one as value cannot exceed 1
-                                    typing_object.value = 1.0
-
-                                    # Set all other instances of item to value
-                                    for neuron in network.neurons.values():
-                                        if neuron.code == typing_object.code:
-                                            neuron.value = 1.0
-                                else:
-                                    typing_object.value = float(typing_string)
-
-                                    # Set all other instances of item to value
-                                    for neuron in network.neurons.values():
-                                        if neuron.code == typing_object.code:
-                                            neuron.value = float(typing_string)
+                                # Change neuron values, a value cannot exceed 1
+                                typing_object.value = min(float(typing_string), 1.0)
                             elif typing_item == "weight":
                                 typing_object.weight = float(typing_string)
 
-                                # Set all other instances of item to value
-                                for neuron in network.neurons.values():
-                                    for conn_ind, conn in enumerate(neuron.incoming_connections):
-                                        if (conn.source.code == typing_object.source.code
-                                                and neuron.code == typing_object.target.code):
-                                            conn.weight = float(typing_string)
+                                # Recompile the weight matrix and redraw the arrows on the next frame
+                                network.invalidate()
+                                edge_layer = None
+                                edge_tables = {}
+                                simulation.send_weight(typing_object.source.key, typing_object.target.key,
+                                                       typing_object.weight)
                             elif typing_item == "bias":
                                 typing_object.bias = float(typing_string)
-
-                                # Set all other instances of item to value
-                                for neuron in network.neurons.values():
-                                    if neuron.code == typing_object.code:
-                                        neuron.bias = float(typing_string)
                             elif typing_item == "decay":
                                 if float(typing_string) == 0:
                                     typing_string = "0.0000001"
                                 typing_object.decay = float(typing_string)
 
-                                # Set all other instances of item to value
-                                for neuron in network.neurons.values():
-                                    if neuron.code == typing_object.code:
-                                        neuron.decay = float(typing_string)
+                            # Have the simulation thread continue from the edited numbers
+                            if typing_item != "weight":
+                                network.mark_edited(typing_object.key)
+                                simulation.send_edits()
                         except ValueError:
                             pass
 
@@ -269,6 +433,14 @@ def visualize_network(network, model_path):
                         typing_item = None
                         typing_object = None
 
+                elif event.key == pygame.K_HOME:
+                    # Return to the original view
+                    viewport.reset()
+                    redraw_graph = True
+                elif event.key == pygame.K_ESCAPE:
+                    # Clear the box selection
+                    selected_neurons = set()
+                    redraw_graph = True
                 elif event.key == pygame.K_BACKSPACE:
                     # Delete last typing string character
                     if is_typing:
@@ -279,11 +451,67 @@ def visualize_network(network, model_path):
                     if is_typing:
                         typing_string += event.unicode
 
+            elif event.type == pygame.MOUSEWHEEL:
+                m_x, m_y = pygame.mouse.get_pos()
+                if m_x <= right_shift:
+                    # Scroll through the incoming connections when the wheel is turned over the panel
+                    if is_viewing:
+                        last_connection = max(len(clicked_neuron.incoming_connections) - 1, 0)
+                        panel_scroll = min(max(panel_scroll - event.y, 0), last_connection)
+                        redraw_panel = True
+                else:
+                    # Zoom the pathway around the mouse
+                    viewport.zoom_at(m_x, m_y, zoom_step ** event.y)
+                    redraw_graph = True
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.pos[0] > right_shift:
+                    if event.button == 1:
+                        # Start a selection box when the left button is pressed over the pathway
+                        drag_start = event.pos
+                        drag_end = event.pos
+                    elif event.button == 3:
+                        # Start panning when the right button is pressed over the pathway
+                        pan_start = event.pos
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3 and pan_start is not None:
+                # Stop panning without treating the release as a click
+                pan_start = None
+            elif event.type == pygame.MOUSEMOTION:
+                m_x, m_y = event.pos
+                if pan_start is not None:
+                    # Drag the pathway along with the mouse
+                    viewport.pan(*event.rel)
+                    redraw_graph = True
+                elif drag_start is not None:
+                    # Stretch the selection box to the mouse
+                    drag_end = event.pos
+                    redraw_graph = True
+                else:
+                    # Label the neuron under the mouse, redrawing only when it changes
+                    hovered = None
+                    if m_x > right_shift:
+                        shown_grid = collapsed_grid if viewport.zoom < low_detail_zoom else neuron_grid
+                        hovered = shown_grid.nearest(*viewport.to_world(m_x, m_y), 6 / viewport.scale)
+                    if hovered != hovered_neuron:
+                        hovered_neuron = hovered
+                        redraw_graph = True
             elif event.type == pygame.MOUSEBUTTONUP:
                 m_x, m_y = pygame.mouse.get_pos()
+                redraw_panel = True
+
+                # Select the neurons inside the box if the mouse was dragged across the pathway
+                is_dragging = (drag_start is not None
+                               and max(abs(m_x - drag_start[0]), abs(m_y - drag_start[1])) > 4)
+                if is_dragging:
+                    left, right = sorted((drag_start[0], m_x))
+                    top, bottom = sorted((drag_start[1], m_y))
+                    shown_grid = collapsed_grid if viewport.zoom < low_detail_zoom else neuron_grid
+                    selected_neurons = set(shown_grid.query_rect(*viewport.to_world(left, top),
+                                                                 *viewport.to_world(right, bottom)))
+                    redraw_graph = True
+                drag_start = None
 
                 # If you are viewing a neuron panel...
-                if is_viewing:
+                if is_viewing and not is_dragging:
 
                     if 115 <= m_x <= 115 + 40 and 50 <= m_y <= 50 + 20:
                         # If current neuron value is clicked, turn on typing for value
@@ -309,14 +537,15 @@ def visualize_network(network, model_path):
                         typing_string = ""
                         typing_ind = -1
 
-                    # Check if the user wants to change any of the incoming connections
-                    offset_copy = offset
-                    for conn_ind, conn in enumerate(clicked_neuron.incoming_connections):
-                        offset_copy += offset_increment
+                    # Work out which incoming connection row (from the scroll position) is under the mouse
+                    incoming = clicked_neuron.incoming_connections
+                    row, row_y = divmod(m_y - offset - offset_increment, offset_increment)
+                    conn_ind = panel_scroll + int(row)
+                    if 135 <= m_x <= 135 + 40 and row >= 0 and conn_ind < len(incoming):
+                        conn = incoming[conn_ind]
 
                         # If incoming connection value is clicked
-                        if (135 <= m_x <= 135 + 40
-                                and 50 + offset_copy <= m_y <= 50 + offset_copy + 20):
+                        if 50 <= row_y <= 50 + 20:
                             # Start incoming value typing state
                             is_typing = True
                             typing_item = "inc_value"
@@ -325,8 +554,7 @@ def visualize_network(network, model_path):
                             typing_ind = conn_ind
 
                         # If incoming connection weight is clicked
-                        if (135 <= m_x <= 135 + 40
-                                and 75 + offset_copy <= m_y <= 75 + offset_copy + 20):
+                        if 75 <= row_y <= 75 + 20:
                             # Start weight typing state
                             is_typing = True
                             typing_item = "weight"
@@ -334,94 +562,91 @@ def visualize_network(network, model_path):
                             typing_string = ""
                             typing_ind = conn_ind
 
-                # Check if the user clicked a neuron
-                for neuron in neurons:
-                    n_x, n_y = neuron.pos
-                    if (graph_scale * n_x - 6 + right_shift <= m_x <= graph_scale * n_x + 6 + right_shift
-                            and graph_scale * n_y - 6 <= m_y <= graph_scale * n_y + 6):
+                # Check if the user clicked a neuron, the last one drawn wins where circles overlap (neurons under
+                # the panel are hidden, so clicks on its buttons never select them)
+                if not is_dragging and m_x > right_shift:
+                    shown_grid = collapsed_grid if viewport.zoom < low_detail_zoom else neuron_grid
+                    clicked = shown_grid.query_box(*viewport.to_world(m_x, m_y), 6 / viewport.scale)
+                    if clicked:
                         # Set state as viewing that neuron in the panel
                         is_viewing = True
-                        clicked_neuron = neuron
+                        clicked_neuron = clicked[-1]
+                        panel_scroll = 0
 
                         is_typing = False
                         typing_item = None
                         typing_object = None
                         typing_string = ""
 
+        if not running:
+            break
+
+        # Show the newest step the simulation thread has finished
+        if scrub_index is None and simulation.apply_latest():
+            redraw_panel = True
+            redraw_graph = True
+
+        screen_width, screen_height = pygame.display.get_surface().get_size()
+        panel_rect = pygame.Rect(0, 0, right_shift, screen_height)
+        graph_rect = pygame.Rect(right_shift, 0, max(screen_width - right_shift, 0), screen_height)
+        dirty_rects = []
+
+        # Redraw the panel only when what it shows has changed
+        if redraw_panel:
+            screen.set_clip(panel_rect)
+            screen.fill(pygame.Color("grey"), panel_rect)
+            dirty_rects.append(panel_rect)
+
         # Manage all neuron panel interactions
-        if is_viewing:
+        if redraw_panel and is_viewing:
             # Update panel specifically if the user is currently editing a value
             if is_typing:
                 # Render neuron code and type
-                text_surface = font.render(clicked_neuron.code,
-                                           False,
-                                           (75, 75, 0))
-                type_surface = font.render("T: " + str(clicked_neuron.type),
-                                           False,
-                                           (75, 75, 0))
+                text_surface = text_cache.render(clicked_neuron.code, (75, 75, 0))
+                type_surface = text_cache.render("T: " + str(clicked_neuron.type), (75, 75, 0))
 
                 if typing_item == "value":
                     # If currently editing current neuron value, render value with currently typed string
-                    value_surface = font.render("V: " + typing_string,
-                                                False,
-                                                (75, 75, 0))
-                    bias_surface = font.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
-                                               False,
-                                               (75, 75, 0))
-                    decay_surface = font.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
-                                               False, (75, 75, 0))
+                    value_surface = text_cache.render("V: " + typing_string, (75, 75, 0))
+                    bias_surface = text_cache.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
+                                                     (75, 75, 0))
+                    decay_surface = text_cache.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
+                                                      (75, 75, 0))
                 elif typing_item == "bias":
                     # If currently editing bias, render bias with currently typed string
-                    value_surface = font.render("V: " + str(round(clicked_neuron.value, num_decimals)),
-                                                False,
-                                                (75, 75, 0))
-                    bias_surface = font.render("B: " + typing_string,
-                                               False,
-                                               (75, 75, 0))
-                    decay_surface = font.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
-                                               False, (75, 75, 0))
+                    value_surface = text_cache.render("V: " + str(round(clicked_neuron.value, num_decimals)),
+                                                      (75, 75, 0))
+                    bias_surface = text_cache.render("B: " + typing_string, (75, 75, 0))
+                    decay_surface = text_cache.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
+                                                      (75, 75, 0))
                 elif typing_item == "decay":
                     # If currently editing decay, render decay with currently typed string
-                    value_surface = font.render("V: " + str(round(clicked_neuron.value, num_decimals)),
-                                                False,
-                                                (75, 75, 0))
-                    bias_surface = font.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
-                                               False,
-                                               (75, 75, 0))
-                    decay_surface = font.render("D: " + typing_string,
-                                               False, (75, 75, 0))
+                    value_surface = text_cache.render("V: " + str(round(clicked_neuron.value, num_decimals)),
+                                                      (75, 75, 0))
+                    bias_surface = text_cache.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
+                                                     (75, 75, 0))
+                    decay_surface = text_cache.render("D: " + typing_string, (75, 75, 0))
                 else:
                     # If currently editing neither, render normally
-                    value_surface = font.render("V: " + str(round(clicked_neuron.value, num_decimals)),
-                                                False, (75, 75, 0))
-                    bias_surface = font.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
-                                               False, (75, 75, 0))
-                    decay_surface = font.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
-                                                False, (75, 75, 0))
-
-                activation_surface = font.render("A: " + str(clicked_neuron.activation_type),
-                                                 False,
-                                                 (75, 75, 0))
+                    value_surface = text_cache.render("V: " + str(round(clicked_neuron.value, num_decimals)),
+                                                      (75, 75, 0))
+                    bias_surface = text_cache.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
+                                                     (75, 75, 0))
+                    decay_surface = text_cache.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
+                                                      (75, 75, 0))
+
+                activation_surface = text_cache.render("A: " + str(clicked_neuron.activation_type), (75, 75, 0))
             else:
                 # If the user is not typing, render everything normally
-                text_surface = font.render(clicked_neuron.code,
-                                           False,
-                                           (75, 75, 0))
-                type_surface = font.render("T: " + str(clicked_neuron.type),
-                                           False,
-                                           (75, 75, 0))
-                value_surface = font.render("V: " + str(round(clicked_neuron.value, num_decimals)),
-                                            False,
-                                            (75, 75, 0))
-                bias_surface = font.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
-                                           False,
-                                           (75, 75, 0))
-                decay_surface = font.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
-                                           False,
-                                           (75, 75, 0))
-                activation_surface = font.render("A: " + str(clicked_neuron.activation_type),
-                                                 False,
+                text_surface = text_cache.render(clicked_neuron.code, (75, 75, 0))
+                type_surface = text_cache.render("T: " + str(clicked_neuron.type), (75, 75, 0))
+                value_surface = text_cache.render("V: " + str(round(clicked_neuron.value, num_decimals)),
+                                                  (75, 75, 0))
+                bias_surface = text_cache.render("B: " + str(round(clicked_neuron.bias, num_decimals)),
                                                  (75, 75, 0))
+                decay_surface = text_cache.render("D: " + str(round(clicked_neuron.decay, num_decimals)),
+                                                  (75, 75, 0))
+                activation_surface = text_cache.render("A: " + str(clicked_neuron.activation_type), (75, 75, 0))
             # Always render neuron code, type, and value
             screen.blit(text_surface,
                         (0, 0))
@@ -448,58 +673,43 @@ def visualize_network(network, model_path):
                 screen.blit(edit,
                             (115, 100))
 
-            # For each incoming connection, render panel components
-            for conn_ind, conn in enumerate(clicked_neuron.incoming_connections):
+            # For each incoming connection that fits on the screen from the scrolled-to one, render panel components
+            incoming = clicked_neuron.incoming_connections
+            num_visible = max(-(-(screen_height - offset) // offset_increment) - 1, 0)
+            for conn_ind in range(panel_scroll, min(len(incoming), panel_scroll + num_visible)):
+                conn = incoming[conn_ind]
                 offset += offset_increment
 
                 # If you are editing a value on the current connection, render it so that the user can type cleanly
                 if is_typing and conn_ind == typing_ind:
                     # Always render the neuron code and the type
-                    inc_text_surface = font.render(conn.source.code,
-                                                   False,
-                                                   (0, 0, 0))
-                    inc_type_surface = font.render("T: " + str(conn.source.type),
-                                                   False,
-                                                   (0, 0, 0))
+                    inc_text_surface = text_cache.render(conn.source.code, (0, 0, 0))
+                    inc_type_surface = text_cache.render("T: " + str(conn.source.type), (0, 0, 0))
 
                     if typing_item == "inc_value":
                         # If currently editing current connection value, render value with currently typed string
-                        inc_value_surface = font.render("V: " + typing_string,
-                                                        False,
-                                                        (0, 0, 0))
-                        inc_weight_surface = font.render("W: " + str(round(conn.weight, num_decimals)),
-                                                         False,
-                                                         (0, 0, 0))
+                        inc_value_surface = text_cache.render("V: " + typing_string, (0, 0, 0))
+                        inc_weight_surface = text_cache.render("W: " + str(round(conn.weight, num_decimals)),
+                                                               (0, 0, 0))
                     elif typing_item == "weight":
                         # If currently editing current connection weight, render weight with currently typed string
-                        inc_value_surface = font.render("V: " + str(round(conn.source.value, num_decimals)),
-                                                        False,
-                                                        (0, 0, 0))
-                        inc_weight_surface = font.render("W: " + typing_string,
-                                                         False,
-                                                         (0, 0, 0))
+                        inc_value_surface = text_cache.render("V: " + str(round(conn.source.value, num_decimals)),
+                                                              (0, 0, 0))
+                        inc_weight_surface = text_cache.render("W: " + typing_string, (0, 0, 0))
                     else:
                         # If currently editing neither, render normally
-                        inc_value_surface = font.render("V: " + str(round(conn.source.value, num_decimals)),
-                                                        False,
-                                                        (0, 0, 0))
-                        inc_weight_surface = font.render("W: " + str(round(conn.weight, num_decimals)),
-                                                         False,
-                                                         (0, 0, 0))
+                        inc_value_surface = text_cache.render("V: " + str(round(conn.source.value, num_decimals)),
+                                                              (0, 0, 0))
+                        inc_weight_surface = text_cache.render("W: " + str(round(conn.weight, num_decimals)),
+                                                               (0, 0, 0))
                 else:
                     # If the user is not typing, render everything normally
-                    inc_text_surface = font.render(conn.source.code,
-                                                   False,
-                                                   (0, 0, 0))
-                    inc_type_surface = font.render("T: " + str(conn.source.type),
-                                                   False,
-                                                   (0, 0, 0))
-                    inc_value_surface = font.render("V: " + str(round(conn.source.value, num_decimals)),
-                                                    False,
-                                                    (0, 0, 0))
-                    inc_weight_surface = font.render("W: " + str(round(conn.weight, num_decimals)),
-                                                     False,
-                                                     (0, 0, 0))
+                    inc_text_surface = text_cache.render(conn.source.code, (0, 0, 0))
+                    inc_type_surface = text_cache.render("T: " + str(conn.source.type), (0, 0, 0))
+                    inc_value_surface = text_cache.render("V: " + str(round(conn.source.value, num_decimals)),
+                                                          (0, 0, 0))
+                    inc_weight_surface = text_cache.render("W: " + str(round(conn.weight, num_decimals)),
+                                                           (0, 0, 0))
                 # Actually render each incoming connection
                 screen.blit(inc_text_surface,
                             (20, offset))
@@ -516,43 +726,86 @@ def visualize_network(network, model_path):
                 screen.blit(edit,
                             (135, offset + 75))
 
-        # Draw pathway
-        for neuron in neurons:
-            n_x, n_y = neuron.pos
-
-            # Draw connections
-            for connection in neuron.outgoing_connections:
-                t_x, t_y = connection.target.pos
-
-                if connection.weight <= 0:
-                    # Draw negative connection
-                    draw_arrow(screen,
-                               pygame.Vector2(graph_scale * n_x + right_shift, graph_scale * n_y),
-                               pygame.Vector2(graph_scale * t_x + right_shift, graph_scale * t_y),
-                               pygame.Color("red"),
-                               2 * abs(connection.weight),
-                               16,
-                               8)
-                else:
-                    # Draw positive connection
-                    draw_arrow(screen,
-                               pygame.Vector2(graph_scale * n_x + right_shift, graph_scale * n_y),
-                               pygame.Vector2(graph_scale * t_x + right_shift, graph_scale * t_y),
-                               pygame.Color("lightblue"),
-                               2 * abs(connection.weight),
-                               16,
-                               8)
-
-        # Draw neurons
-        for neuron in neurons:
-            n_x, n_y = neuron.pos
-            pygame.draw.circle(screen,
-                               (0, 255 * neuron.value, 0),
-                               (graph_scale * n_x + right_shift, graph_scale * n_y),
-                               6)
-
-        pygame.display.flip()
-
+        # Show how far the simulation has run and whether it is still running
+        if redraw_panel:
+            if scrub_index is not None:
+                state = f"viewing step {recorder.frame(scrub_index)[0]}"
+            elif simulation.is_playing:
+                state = f"playing {simulation.steps_per_second:g}/s"
+            elif simulation.pending_steps:
+                state = f"{simulation.pending_steps} step(s) queued"
+            else:
+                state = "paused"
+            status_surface = text_cache.render(f"Step {simulation.steps_taken}, {state}", (0, 0, 0))
+            screen.fill(pygame.Color("grey"), pygame.Rect(0, screen_height - 25, right_shift, 25))
+            screen.blit(status_surface,
+                        (0, screen_height - 22))
+
+        # Redraw the pathway only when the values or weights have changed
+        if redraw_graph:
+            screen.set_clip(graph_rect)
+            dirty_rects.append(graph_rect)
+
+            # Collapse groups into their group neuron and merge nearby connections when zoomed far out
+            low_detail = viewport.zoom < low_detail_zoom
+            shown_grid = collapsed_grid if low_detail else neuron_grid
+
+            # Draw the cached connections, rendering them again after a weight edit, a resize or a view change
+            layer_key = (screen.get_size(), viewport.key(), low_detail)
+            if edge_layer is None or layer_key != edge_layer_key:
+                if low_detail not in edge_tables:
+                    edge_tables[low_detail] = edge_table(neurons, collapsed if low_detail else None)
+                edge_layer = render_edge_layer(edge_tables[low_detail], screen.get_size(), viewport, graph_rect,
+                                               low_detail)
+                edge_layer_key = layer_key
+            screen.blit(edge_layer, graph_rect, graph_rect)
+
+            # Draw the neurons whose circles reach into the visible part of the pathway
+            for neuron in shown_grid.query_rect(*viewport.world_rect(graph_rect.inflate(12, 12))):
+                pygame.draw.circle(screen,
+                                   (0, 255 * neuron.value, 0),
+                                   viewport.to_screen(*neuron.pos),
+                                   6)
+
+            # Outline the selected neurons
+            for neuron in selected_neurons:
+                pygame.draw.circle(screen,
+                                   pygame.Color("blue"),
+                                   viewport.to_screen(*neuron.pos),
+                                   9,
+                                   2)
+
+            # Draw the selection box while it is dragged
+            if drag_start is not None:
+                pygame.draw.rect(screen,
+                                 pygame.Color("blue"),
+                                 pygame.Rect(min(drag_start[0], drag_end[0]),
+                                             min(drag_start[1], drag_end[1]),
+                                             abs(drag_end[0] - drag_start[0]),
+                                             abs(drag_end[1] - drag_start[1])),
+                                 1)
+
+            # Label the neuron under the mouse with its code and value
+            if hovered_neuron is not None:
+                n_x, n_y = viewport.to_screen(*hovered_neuron.pos)
+                label = text_cache.render(hovered_neuron.code + "  V: "
+                                          + str(round(hovered_neuron.value, num_decimals)),
+                                          (0, 0, 0))
+                label_rect = label.get_rect(topleft=(n_x + 10, n_y - 28))
+                screen.fill((255, 255, 224), label_rect.inflate(6, 4))
+                screen.blit(label, label_rect)
+
+        # Only send the redrawn regions to the display, then wait out the rest of the frame
+        screen.set_clip(None)
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
+        redraw_panel = False
+        redraw_graph = False
+        clock.tick(max_frame_rate)
+
+    # Let the simulation thread finish the requested steps so the network ends on the last one, not a recorded one
+    simulation.stop()
+    simulation.apply_latest(force=scrub_index is not None)
     pygame.quit()
 
 
@@ -565,7 +818,7 @@ def display_kgml(kgml_path, model_path, is_generating_model, generated_model_fil
         is_generating_model (bool): Determines if the application will make a model file
         generated_model_file_name (str): The name of the file that will store your generated model
     """
-    neural_network = parse_kgml(kgml_path)
+    neural_network = PathwayCache().load(kgml_path)
     visualize_network(neural_network, model_path)
     if is_generating_model:
         neural_network.generate_model_file(generated_model_file_name)
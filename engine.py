@@ -0,0 +1,377 @@
+"""Compiles a neural network into contiguous arrays so it can be propagated with vectorized operations"""
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from activations import get_activation
+
+# SciPy's private CSR kernels multiply into an existing array (their signature has been the same from SciPy 0.x up to
+# at least 1.17). They are checked once here, and if a SciPy release moves or changes them multiply_into falls back
+# to the public matrix @ vector, which allocates a new array every step.
+try:
+    from scipy.sparse._sparsetools import csr_matvec, csr_matvecs
+except ImportError:
+    csr_matvec = csr_matvecs = None
+
+
+def _check_private_kernels():
+    """Returns whether the private CSR kernels compute a small product correctly"""
+    matrix = csr_matrix(np.array([[0.0, 2.0], [3.0, 0.0]]))
+    vector = np.array([1.0, 4.0])
+    vectors = np.array([[1.0, 5.0], [4.0, 6.0]])
+    out = np.zeros(2)
+    outs = np.zeros((2, 2))
+    try:
+        csr_matvec(2, 2, matrix.indptr, matrix.indices, matrix.data, vector, out)
+        csr_matvecs(2, 2, 2, matrix.indptr, matrix.indices, matrix.data, vectors.ravel(), outs.ravel())
+    except (TypeError, ValueError):
+        return False
+    return np.array_equal(out, matrix @ vector) and np.array_equal(outs, matrix @ vectors)
+
+
+if csr_matvec is not None and not _check_private_kernels():
+    csr_matvec = csr_matvecs = None
+
+# Ways a multi-step propagation can finish
+CONVERGED = "converged"
+CYCLE = "cycle"
+MAX_STEPS = "max_steps"
+
+
+def multiply_into(matrix, vector, out):
+    """Computes matrix @ vector into a preallocated array so that stepping does not allocate
+
+    Args:
+        matrix (csr_matrix): the weight matrix
+        vector (np.ndarray): a float64 vector (or C-ordered matrix of column vectors) with one row per matrix column
+        out (np.ndarray): a float64 array shaped like vector with one row per matrix row that receives the product
+    """
+    # The kernels read and write matrices of column vectors through flat views, which a copy would silently replace
+    if vector.ndim > 1 and not (vector.flags.c_contiguous and out.flags.c_contiguous):
+        raise ValueError("multiply_into needs C-ordered matrices of column vectors")
+
+    if csr_matvec is None:
+        np.copyto(out, matrix @ vector)
+        return
+
+    out.fill(0)
+    if vector.ndim == 1:
+        csr_matvec(matrix.shape[0], matrix.shape[1], matrix.indptr, matrix.indices, matrix.data, vector, out)
+    else:
+        csr_matvecs(matrix.shape[0], matrix.shape[1], vector.shape[1],
+                    matrix.indptr, matrix.indices, matrix.data, vector.ravel(), out.ravel())
+
+
+class PropagationResult:
+    """Describes the outcome of propagating a network for several steps"""
+
+    def __init__(self, values, steps, status, max_delta, period=0, trajectory=None):
+        self.values = values
+        self.steps = steps
+        self.status = status
+        self.max_delta = max_delta
+        self.period = period
+        self.trajectory = trajectory
+
+
+class CompiledNetwork:
+    """Packs the values, biases and decays of every code into arrays and the weights between codes into a CSR
+    matrix, one row per canonical gene so that duplicate entries of a code are simulated once"""
+
+    def __init__(self, network, packed=None):
+        self.network = network
+
+        # Arrays laid out like pack() can be compiled without a network, as sweep worker processes do
+        if packed is None:
+            packed = network.pack()
+
+        # The position of a code in this list is its row in every array, every neuron id maps onto one row
+        self.ids = packed["ids"]
+        self.codes = packed["codes"]
+        self.rows = packed["rows"]
+        self.index = dict(zip(self.ids, self.rows.tolist()))
+        size = len(self.codes)
+        self.code_rows = dict(zip(self.codes, range(size)))
+
+        # The per-code state (shared with the network itself when it is array-backed)
+        self.values = packed["values"]
+        self.biases = packed["biases"]
+        self.decays = packed["decays"]
+
+        # Pack every weight between codes as (target row, source column, weight)
+        rows = packed["link_targets"]
+        cols = packed["link_sources"]
+        self.weights = csr_matrix((np.array(packed["link_weights"], dtype=np.float64), (rows, cols)),
+                                  shape=(size, size))
+
+        # Codes without incoming connections are inputs, their values are held constant
+        self.is_clamped = np.bincount(rows, minlength=size) == 0
+
+        # Group the rows by activation function so each function runs once per step on all of its rows
+        self.activation_groups = []
+        self.activation_of = np.zeros(size, dtype=np.intp)
+        names = np.array(packed["activations"], dtype=object)
+        for group, name in enumerate(dict.fromkeys(packed["activations"])):
+            rows_of_name = np.flatnonzero(names == name)
+            self.activation_of[rows_of_name] = group
+            if rows_of_name.size == size:
+                rows_of_name = None
+            self.activation_groups.append((get_activation(name), rows_of_name))
+
+        # The rows whose value may change on the next incremental step, None when that is not known
+        self.active = None
+        self._outgoing = None
+
+        # Scratch buffers reused by every step
+        self._next = np.empty(size)
+        self._scratch = np.empty(size)
+
+    def link_position(self, source_row, target_row):
+        """Returns the position in weights.data of the weight from one row to another, or None if they are not linked
+
+        Args:
+            source_row (int): the row of the source code
+            target_row (int): the row of the target code
+        """
+        start = self.weights.indptr[target_row]
+        found = np.flatnonzero(self.weights.indices[start:self.weights.indptr[target_row + 1]] == source_row)
+        if found.size == 0:
+            return None
+        return int(start + found[0])
+
+    def read_state(self):
+        """Picks up the values, biases and decays edited on the network"""
+        self.network.read_parameters(self.values, self.biases, self.decays)
+        self.active = None
+
+    def write_state(self):
+        """Hands the array values back to the network so every entry in the visual stays in sync"""
+        self.network.write_values(self.values)
+
+    def _compute_next(self):
+        """Computes the values of the next step into the _next buffer"""
+        # Add up the weighted inputs, the bias and the decayed current value of every neuron at once
+        multiply_into(self.weights, self.values, self._next)
+        self._next += self.biases
+        np.divide(self.values, self.decays, out=self._scratch)
+        self._next += self._scratch
+
+        # Use the activation function of each group of rows
+        self._activate(self._next)
+
+        # Hold input neurons constant (they are environment variables)
+        np.copyto(self._next, self.values, where=self.is_clamped)
+
+    def _activate(self, totals):
+        """Applies the activation function of every row to an array of summed inputs in place
+
+        Args:
+            totals (np.ndarray): a vector (or matrix with one row per code) of summed inputs
+        """
+        for activation, rows in self.activation_groups:
+            if rows is None:
+                activation.vectorized(totals, out=totals)
+            else:
+                totals[rows] = activation.vectorized(totals[rows])
+
+    def _max_difference(self, first, second):
+        """Returns the largest absolute difference between two value vectors"""
+        if first.size == 0:
+            return 0.0
+        np.subtract(first, second, out=self._scratch)
+        np.abs(self._scratch, out=self._scratch)
+        return float(self._scratch.max())
+
+    def successors(self, rows):
+        """Returns the sorted rows that the given rows have connections into
+
+        Args:
+            rows (np.ndarray): the source rows
+        """
+        # The transposed matrix lists the targets of every source row, like outgoing_connections
+        if self._outgoing is None:
+            self._outgoing = self.weights.T.tocsr()
+        starts = self._outgoing.indptr[rows]
+        counts = self._outgoing.indptr[rows + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.intp)
+
+        # Gather the slices of every row at once by offsetting a running index to the start of each slice
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        return np.unique(self._outgoing.indices[offsets])
+
+    def _compute_rows(self, rows):
+        """Returns the values of the next step of a sorted subset of rows"""
+        totals = self.weights[rows] @ self.values
+        totals += self.biases[rows]
+        totals += self.values[rows] / self.decays[rows]
+
+        # Use the activation function of each group of rows within the subset
+        groups = self.activation_of[rows]
+        for group, (activation, group_rows) in enumerate(self.activation_groups):
+            if group_rows is None:
+                activation.vectorized(totals, out=totals)
+            else:
+                selected = groups == group
+                totals[selected] = activation.vectorized(totals[selected])
+
+        np.copyto(totals, self.values[rows], where=self.is_clamped[rows])
+        return totals
+
+    def step(self):
+        """Propagates the packed values by 1 step in place"""
+        self._compute_next()
+        self.values[:] = self._next
+        self.active = None
+
+    def step_incremental(self, edited_rows, max_fraction=0.25):
+        """Propagates the packed values by 1 step, recomputing only the rows whose own value or inputs changed
+
+        A row whose value and inputs did not change in the last step would compute the same value again, so only
+        the rows that moved, their successors and the edited rows with their successors are recomputed. The first
+        incremental step after a full step or a read_state recomputes every row.
+
+        Args:
+            edited_rows (np.ndarray): the rows whose value, bias or decay was edited since the last step
+            max_fraction (float): recompute every row once more than this fraction of them would be recomputed
+
+        Returns:
+            np.ndarray: the sorted rows whose value changed
+        """
+        rows = None
+        if self.active is not None:
+            edited_rows = np.asarray(edited_rows, dtype=np.intp)
+            rows = np.union1d(self.active, np.union1d(edited_rows, self.successors(edited_rows)))
+            if rows.size > max_fraction * self.values.size:
+                rows = None
+
+        if rows is None:
+            self._compute_next()
+            changed = np.flatnonzero(self._next != self.values)
+            self.values[:] = self._next
+        else:
+            following = self._compute_rows(rows)
+            moved = following != self.values[rows]
+            changed = rows[moved]
+            self.values[changed] = following[moved]
+
+        self.active = np.union1d(changed, self.successors(changed))
+        return changed
+
+    def run(self, steps, tolerance=None, max_period=0, trajectory=False, recorder=None):
+        """Propagates the packed values for several steps, stopping early once they settle
+
+        Args:
+            steps (int): the maximum number of steps to propagate
+            tolerance (float): stop once no value moves more than this in one step (None always runs every step)
+            max_period (int): the longest oscillation period to watch for, 0 turns cycle detection off
+            trajectory (bool): also return the values before the first step and after every step
+            recorder (TrajectoryRecorder): records the values before the first step and after every step
+
+        Returns:
+            PropagationResult: the final values, the number of steps taken and why propagation stopped
+        """
+        size = self.values.size
+        cycle_tolerance = 0.0 if tolerance is None else tolerance
+
+        # Preallocate everything the loop needs so that stepping itself does not allocate
+        path = None
+        if trajectory:
+            path = np.empty((steps + 1, size))
+            path[0] = self.values
+        if recorder is not None:
+            recorder.record(self.values)
+        history = None
+        if max_period > 1:
+            history = np.empty((max_period, size))
+
+        status = MAX_STEPS
+        period = 0
+        max_delta = 0.0
+        taken = 0
+        while taken < steps:
+            self._compute_next()
+            max_delta = self._max_difference(self._next, self.values)
+
+            # Remember the current values in a ring so later steps can be compared with them
+            if history is not None:
+                history[taken % max_period] = self.values
+            self.values[:] = self._next
+            taken += 1
+            if path is not None:
+                path[taken] = self.values
+            if recorder is not None:
+                recorder.record(self.values)
+
+            # Stop once the values no longer move, which cycle detection would otherwise report as a period of 1
+            if tolerance is not None and max_delta <= tolerance or history is not None and max_delta <= cycle_tolerance:
+                status = CONVERGED
+                break
+
+            # Stop once the values return to where they were a few steps ago
+            if history is not None:
+                for lag in range(2, min(max_period, taken) + 1):
+                    if self._max_difference(self.values, history[(taken - lag) % max_period]) <= cycle_tolerance:
+                        status = CYCLE
+                        period = lag
+                        break
+                if status == CYCLE:
+                    break
+
+        if path is not None:
+            path = path[:taken + 1]
+        self.active = None
+        return PropagationResult(self.values.copy(), taken, status, max_delta, period, path)
+
+    def run_batch(self, values, clamped, steps, tolerance=None, recorder=None):
+        """Propagates many scenarios of the network together, one column of values per scenario
+
+        Args:
+            values (np.ndarray): a (neurons x scenarios) float64 array, propagated in place
+            clamped (np.ndarray): a (neurons x scenarios) bool array of values to hold constant
+            steps (int): the maximum number of steps to propagate
+            tolerance (float): stop once no value in any scenario moves more than this in one step
+            recorder (TrajectoryRecorder): records the (neurons x scenarios) values before the first step and after
+                every step
+
+        Returns:
+            int: the number of steps taken
+        """
+        # Step a C-ordered copy of values laid out any other way, and copy the result back at the end
+        result = values
+        values = np.ascontiguousarray(values, dtype=np.float64)
+
+        # Preallocate the buffers shared by every step
+        following = np.empty_like(values)
+        scratch = np.empty_like(values)
+        biases = self.biases[:, np.newaxis]
+        decays = self.decays[:, np.newaxis]
+        if recorder is not None:
+            recorder.record(values)
+
+        taken = 0
+        while taken < steps:
+            # Do one sparse matrix product for every scenario at once
+            multiply_into(self.weights, values, following)
+            following += biases
+            np.divide(values, decays, out=scratch)
+            following += scratch
+            self._activate(following)
+            np.copyto(following, values, where=clamped)
+
+            # Measure how far the values moved before replacing them
+            converged = False
+            if tolerance is not None:
+                np.subtract(following, values, out=scratch)
+                np.abs(scratch, out=scratch)
+                converged = scratch.size == 0 or scratch.max() <= tolerance
+            values[:] = following
+            taken += 1
+            if recorder is not None:
+                recorder.record(values)
+            if converged:
+                break
+
+        if values is not result:
+            result[...] = values
+        return taken
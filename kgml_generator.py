@@ -0,0 +1,202 @@
+"""Writes synthetic KGML pathways of any size, for testing the parser, model files and engine at scale
+
+The file is written in batches as it is generated, so even pathways with millions of relations never sit in memory.
+
+Example:
+    python kgml_generator.py synthetic.xml --entries 100000 --groups 2000 --relations 1000000
+        --subtype activation=3 --subtype inhibition=1
+"""
+import argparse
+import math
+import sys
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+# The mix of relation subtypes used by default, roughly as often as they appear in the bundled pathways
+DEFAULT_SUBTYPES = {
+    "activation": 110,
+    "phosphorylation": 54,
+    "inhibition": 55,
+    "expression": 32,
+    "binding/association": 19,
+    "missing interaction": 16,
+    "dephosphorylation": 9,
+    "indirect effect": 7,
+    "dissociation": 6,
+    "ubiquitination": 5,
+    "repression": 2,
+}
+
+# The symbol KEGG draws every subtype with
+SUBTYPE_VALUES = {
+    "activation": "-->",
+    "expression": "-->",
+    "indirect effect": "..>",
+    "inhibition": "--|",
+    "repression": "--|",
+    "binding/association": "---",
+    "dissociation": "-+-",
+    "missing interaction": "-/-",
+    "phosphorylation": "+p",
+    "dephosphorylation": "-p",
+    "ubiquitination": "+u",
+    "methylation": "+m",
+}
+
+# Subtypes of gene expression relations, every other subtype is a protein-protein relation
+EXPRESSION_SUBTYPES = ("expression", "repression")
+
+# The spacing of the layout grid, wide enough for KEGG's 46 x 17 gene boxes
+X_SPACING = 60
+Y_SPACING = 30
+
+
+def entry_position(ids, columns):
+    """Returns the x and y coordinates of entries laid out row by row on a grid
+
+    Args:
+        ids (np.ndarray): the entry ids, numbered from 1
+        columns (int): the number of entries in a row
+    """
+    return (ids - 1) % columns * X_SPACING + 50, (ids - 1) // columns * Y_SPACING + 50
+
+
+def write_kgml(file_path, entries=1000, groups=20, relations=2000, subtypes=None, codes=None, compounds=0.05,
+               group_size=3, seed=0, batch_size=10000):
+    """Writes a random KGML pathway that parse_kgml accepts
+
+    Entries are numbered from 1 and laid out on a grid, followed by the groups and then the relations. Relations
+    connect random entries and groups, so several relations can link the same pair.
+
+    Args:
+        file_path (str): the KGML file to write
+        entries (int): the number of gene and compound entries
+        groups (int): the number of group entries
+        relations (int): the number of relations
+        subtypes (dict): the relative frequency of every relation subtype (defaults to DEFAULT_SUBTYPES)
+        codes (int): the number of distinct gene codes, fewer than the genes makes some entries share a code
+            (defaults to one code per gene)
+        compounds (float): the fraction of the entries that are compounds
+        group_size (int): the number of components of every group
+        seed (int): the seed of the random graph
+        batch_size (int): the number of elements generated and written at a time
+    """
+    rng = np.random.default_rng(seed)
+    subtypes = DEFAULT_SUBTYPES if subtypes is None else subtypes
+    names = list(subtypes)
+    elements = [f'<subtype name={quoteattr(name)} value={quoteattr(SUBTYPE_VALUES.get(name, ""))}/>'
+                for name in names]
+    relation_types = ["GErel" if name in EXPRESSION_SUBTYPES else "PPrel" for name in names]
+    frequencies = np.array([subtypes[name] for name in names], dtype=np.float64)
+    frequencies /= frequencies.sum()
+    codes = codes or entries
+    columns = max(math.isqrt(entries), 1)
+
+    with open(file_path, "w", encoding="utf8") as file:
+        file.write('<?xml version="1.0"?>\n'
+                   '<!DOCTYPE pathway SYSTEM "https://www.kegg.jp/kegg/xml/KGML_v0.7.2_.dtd">\n'
+                   '<pathway name="path:hsa99999" org="hsa" number="99999" title="Synthetic pathway">\n')
+
+        # Genes and compounds
+        for start in range(0, entries, batch_size):
+            count = min(batch_size, entries - start)
+            ids = np.arange(start + 1, start + count + 1)
+            xs, ys = entry_position(ids, columns)
+            is_compound = rng.random(count) < compounds
+            gene_codes = rng.integers(0, codes, count) if codes < entries else ids - 1
+            lines = []
+            for id_, x, y, compound, code in zip(ids.tolist(), xs.tolist(), ys.tolist(), is_compound.tolist(),
+                                                 gene_codes.tolist()):
+                if compound:
+                    lines.append(f'    <entry id="{id_}" name="cpd:C{id_:05d}" type="compound">\n'
+                                 f'        <graphics name="C{id_:05d}" type="circle" x="{x}" y="{y}"'
+                                 f' width="8" height="8"/>\n'
+                                 f'    </entry>\n')
+                else:
+                    lines.append(f'    <entry id="{id_}" name="hsa:{code + 1}" type="gene">\n'
+                                 f'        <graphics name="G{code + 1}, SYN{code + 1}" type="rectangle"'
+                                 f' x="{x}" y="{y}" width="46" height="17"/>\n'
+                                 f'    </entry>\n')
+            file.write("".join(lines))
+
+        # Groups of random entries, drawn where their first component is
+        for start in range(0, groups, batch_size):
+            count = min(batch_size, groups - start)
+            ids = np.arange(entries + start + 1, entries + start + count + 1)
+            components = rng.integers(1, entries + 1, (count, group_size)) if entries else np.ones((count, 0), int)
+            xs, ys = entry_position(components[:, 0] if group_size and entries else np.ones(count, int), columns)
+            lines = []
+            for id_, members, x, y in zip(ids.tolist(), components.tolist(), xs.tolist(), ys.tolist()):
+                lines.append(f'    <entry id="{id_}" name="undefined" type="group">\n'
+                             f'        <graphics type="rectangle" x="{x}" y="{y}" width="46" height="34"/>\n')
+                lines.extend(f'        <component id="{member}"/>\n' for member in members)
+                lines.append('    </entry>\n')
+            file.write("".join(lines))
+
+        # Relations between random entries and groups
+        total = entries + groups
+        for start in range(0, relations if total else 0, batch_size):
+            count = min(batch_size, relations - start)
+            sources = rng.integers(1, total + 1, count)
+            targets = rng.integers(1, total + 1, count)
+            kinds = rng.choice(len(names), count, p=frequencies)
+            lines = []
+            for source, target, kind in zip(sources.tolist(), targets.tolist(), kinds.tolist()):
+                lines.append(f'    <relation entry1="{source}" entry2="{target}" type="{relation_types[kind]}">\n'
+                             f'        {elements[kind]}\n'
+                             f'    </relation>\n')
+            file.write("".join(lines))
+
+        file.write("</pathway>\n")
+
+
+def parse_subtypes(pairs):
+    """Turns NAME=WEIGHT arguments into a subtype mix, or None for the default mix
+
+    Args:
+        pairs (list): the NAME=WEIGHT strings
+    """
+    if not pairs:
+        return None
+    subtypes = {}
+    for pair in pairs:
+        name, _, weight = pair.rpartition("=")
+        if not name:
+            raise ValueError("Expected NAME=WEIGHT, got " + repr(pair))
+        subtypes[name] = float(weight)
+    return subtypes
+
+
+def parse_args(argv):
+    """Reads the command line arguments
+
+    Args:
+        argv (list): the arguments after the program name
+    """
+    parser = argparse.ArgumentParser(description="Write a synthetic KGML pathway")
+    parser.add_argument("output", help="the KGML file to write")
+    parser.add_argument("--entries", type=int, default=1000, help="the number of gene and compound entries")
+    parser.add_argument("--groups", type=int, default=20, help="the number of group entries")
+    parser.add_argument("--relations", type=int, default=2000, help="the number of relations")
+    parser.add_argument("--subtype", action="append", default=[], metavar="NAME=WEIGHT",
+                        help="give a relation subtype a relative frequency (repeatable, replaces the default mix)")
+    parser.add_argument("--codes", type=int, default=None,
+                        help="the number of distinct gene codes (defaults to one per gene)")
+    parser.add_argument("--compounds", type=float, default=0.05, help="the fraction of entries that are compounds")
+    parser.add_argument("--group-size", type=int, default=3, help="the number of components of every group")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the random graph")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Writes the pathway described by the command line"""
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    write_kgml(args.output, args.entries, args.groups, args.relations, parse_subtypes(args.subtype), args.codes,
+               args.compounds, args.group_size, args.seed)
+    print(f"Wrote {args.entries} entries, {args.groups} groups and {args.relations} relations to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
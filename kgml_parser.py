@@ -0,0 +1,211 @@
+"""Streams a KGML file into a neural network without loading the whole XML tree"""
+import xml.etree.ElementTree as ET
+
+from networking import NO_CODE, NeuralNetwork, Neuron
+
+# Relation subtypes that activate or inhibit their target (THIS CAN/SHOULD BE UPDATED AS WE GAIN MORE KNOWLEDGE OF EFFECTS)
+POSITIVE_RELATIONS = ("activation", "expression", "binding/association", "indirect effect", "missing interaction",
+                      "phosphorylation")
+NEGATIVE_RELATIONS = ("inhibition", "repression", "dissociation", "methylation", "dephosphorylation")
+
+# Bump whenever the way entries and relations are turned into neurons and connections changes (invalidates caches)
+RELATION_MAPPING_VERSION = 1
+
+
+def relation_weight(relation):
+    """Returns the weight a relation element maps to, or None if its first subtype has no known effect
+
+    Args:
+        relation (ET.Element): a KGML relation element
+    """
+    # Only the first subtype of a relation determines its effect
+    for subtype in relation.iter("subtype"):
+        type_ = subtype.attrib["name"]
+        if type_ in POSITIVE_RELATIONS:
+            return 1
+        if type_ in NEGATIVE_RELATIONS:
+            return -1
+        return None
+    return None
+
+
+def entry_graphics(entry):
+    """Returns the graphics name and the coordinates of an entry element (correlates with KGML file)
+
+    Args:
+        entry (ET.Element): a KGML entry element
+    """
+    pos = (0, 0)
+    graphics_name = NO_CODE
+    for graphics in entry.iter("graphics"):
+        if "name" in graphics.attrib:
+            graphics_name = graphics.attrib["name"].split(",")[0].split(".")[0]
+        pos = (int(graphics.attrib["x"]), int(graphics.attrib["y"]))
+    return graphics_name, pos
+
+
+def parse_kgml(file_path):
+    """Takes in a KGML file, returns a neural network
+
+    The file is read in one forward pass with iterparse and every top-level element is cleared as soon as it ends,
+    whatever its tag, so memory stays bounded by the network rather than the XML tree.
+    Groups and relations that reference entries which have not been seen yet are deferred to the end.
+
+    Args:
+        file_path (str): the filepath
+    """
+    neural_net = NeuralNetwork()
+    groups = {}
+    pending_groups = []
+    pending_relations = []
+    counter = 0
+    root = None
+    depth = 0
+
+    def find_neuron(id_):
+        """Looks an entry up among the neurons and the groups parsed so far"""
+        if id_ in neural_net.neurons:
+            return neural_net.neurons[id_]
+        return groups.get(id_)
+
+    def connect_group(group_neuron, component_ids):
+        """Connect the components of the group to the group"""
+        for component_id in component_ids:
+            component_neuron = find_neuron(component_id)
+            if component_neuron is None:
+                raise KeyError(component_id)
+            component_neuron.connect(group_neuron, 1 / len(component_ids))
+
+    for event, element in ET.iterparse(file_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        # Children of entries and relations are read by their parent before it is cleared
+        depth -= 1
+        if depth != 1:
+            continue
+
+        if element.tag == "entry":
+            type_ = element.attrib["type"]
+            if type_ == "group":
+                # Create a neuron to represent the group
+                counter += 1
+                _, pos = entry_graphics(element)
+                group_neuron = Neuron(element.attrib["id"],
+                                      element.attrib["name"] + str(counter),
+                                      "group",
+                                      pos,
+                                      "Group" + str(counter))
+                groups[element.attrib["id"]] = group_neuron
+
+                # Connect the group now if all of its components are known, otherwise wait for them
+                component_ids = [component.attrib["id"] for component in element.iter("component")]
+                neural_net.group_components[element.attrib["id"]] = component_ids
+                if all(find_neuron(component_id) is not None for component_id in component_ids):
+                    connect_group(group_neuron, component_ids)
+                else:
+                    pending_groups.append((group_neuron, component_ids))
+            elif type_ != "map":
+                # Create a neuron to represent the Entry (ignore irrelevant map entries)
+                id_ = element.attrib["id"]
+                name = element.attrib["name"].split(",")[0].split(".")[0]
+                graphics_name, pos = entry_graphics(element)
+                neural_net.neurons[id_] = Neuron(id_, name, type_, pos, graphics_name)
+        elif element.tag == "relation":
+            # Determine the two entries that are being interacted with and the effect between them
+            source_id = element.attrib["entry1"]
+            target_id = element.attrib["entry2"]
+            weight = relation_weight(element)
+
+            # Keep relations in file order once one of them has had to wait for its entries
+            if pending_relations or find_neuron(source_id) is None or find_neuron(target_id) is None:
+                pending_relations.append((source_id, target_id, weight))
+            elif weight is not None:
+                find_neuron(source_id).connect(find_neuron(target_id), weight)
+
+        # Drop every finished child of the root, reactions and any other element included, and everything the root
+        # still holds onto
+        element.clear()
+        root.clear()
+
+    # Resolve everything that referenced entries appearing later in the file
+    for group_neuron, component_ids in pending_groups:
+        connect_group(group_neuron, component_ids)
+    for source_id, target_id, weight in pending_relations:
+        source_neuron = find_neuron(source_id)
+        target_neuron = find_neuron(target_id)
+        if source_neuron is None or target_neuron is None:
+            raise KeyError(source_id if source_neuron is None else target_id)
+        if weight is not None:
+            source_neuron.connect(target_neuron, weight)
+
+    # Groups come after the other entries in the network, as they always have
+    neural_net.neurons.update(groups)
+    neural_net.share_parameters()
+    return neural_net
+
+
+def merge_kgml(file_paths, load=parse_kgml, margin=100):
+    """Takes in several KGML files, returns one neural network in which entries sharing a code are one neuron
+
+    Groups are unified when they have the same components, entries without a code stay separate, and a relation
+    between two codes is only kept the first time it is seen. Each pathway is laid out to the right of the
+    previous one.
+
+    Args:
+        file_paths (list): the filepaths of the KGML files
+        load (function): turns a filepath into a network (PathwayCache().load skips parsing cached files)
+        margin (int): the horizontal gap left between pathways
+    """
+    merged = NeuralNetwork()
+    nodes = {}
+    edges = set()
+    x_offset = 0
+    group_counter = 0
+
+    for file_path in file_paths:
+        network = load(file_path)
+        keys = {}
+
+        # Find or create the merged neuron of every entry (groups come after their components)
+        for id_, neuron in network.neurons.items():
+            if id_ in network.group_components:
+                key = ("group", frozenset(keys.get(component_id, (file_path, component_id))
+                                          for component_id in network.group_components[id_]))
+            elif neuron.code == NO_CODE:
+                key = (file_path, id_)
+            else:
+                key = neuron.code
+            keys[id_] = key
+            if key in nodes:
+                continue
+
+            code = neuron.code
+            if id_ in network.group_components:
+                group_counter += 1
+                code = "Group" + str(group_counter)
+            merged_id = str(len(nodes) + 1)
+            merged_neuron = Neuron(merged_id, neuron.name, neuron.type, (neuron.pos[0] + x_offset, neuron.pos[1]), code)
+            merged.neurons[merged_id] = merged_neuron
+            nodes[key] = merged_neuron
+            if id_ in network.group_components:
+                merged.group_components[merged_id] = [nodes[keys[component_id]].id_
+                                                       for component_id in network.group_components[id_]
+                                                       if component_id in keys]
+
+        # Copy every connection whose pair of merged neurons is not connected yet
+        for id_, neuron in network.neurons.items():
+            for conn in neuron.incoming_connections:
+                edge = (keys[conn.source.id_], keys[id_])
+                if edge not in edges:
+                    edges.add(edge)
+                    nodes[edge[0]].connect(nodes[edge[1]], conn.weight)
+
+        if network.neurons:
+            x_offset += max(neuron.pos[0] for neuron in network.neurons.values()) + margin
+
+    merged.share_parameters()
+    return merged
@@ -1,16 +1,22 @@
 """Create the GUI which will be able to start up the KGML visualizer"""
+import multiprocessing
 import os
 import sys
 
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import (QFileDialog,
                                QLabel,
                                QLineEdit,
+                               QListWidget,
                                QPushButton,
                                QVBoxLayout,
                                QWidget,
                                QApplication)
 
-from create_visual import display_kgml
+from session_launcher import SessionLauncher
+
+# How often (in milliseconds) the list of running sessions is checked for sessions that have ended
+SESSION_POLL_INTERVAL = 500
 
 
 class MyWidget(QWidget):
@@ -23,6 +29,7 @@ class MyWidget(QWidget):
         self.kgml_file_name = ""
         self.old_kgml_file_name = ""
         self.model_file_name = ""
+        self.launcher = SessionLauncher()
         self.setWindowTitle("KGML Model Creator GUI")
 
         # Set up GUI Components
@@ -34,6 +41,9 @@ class MyWidget(QWidget):
         self.choose_model_file_button = QPushButton("Choose Model File (Optional)")
         self.toggle_generate_model_button = QPushButton("Toggle Model Generation: currently off")
         self.run_button = QPushButton("Run Simulation")
+        self.sessions_text = QLabel("Running Simulations:")
+        self.sessions_list = QListWidget()
+        self.cancel_button = QPushButton("Cancel Selected Simulation")
 
         # Set Initial State of GUI Components
         self.toggle_generate_model_button.setCheckable(True)
@@ -51,12 +61,21 @@ class MyWidget(QWidget):
         self.layout.addWidget(self.choose_model_file_button)
         self.layout.addWidget(self.toggle_generate_model_button)
         self.layout.addWidget(self.run_button)
+        self.layout.addWidget(self.sessions_text)
+        self.layout.addWidget(self.sessions_list)
+        self.layout.addWidget(self.cancel_button)
 
         # Make GUI components clickable and assign them to callback functions
         self.choose_kgml_file_button.clicked.connect(self.choose_kgml_file)
         self.choose_model_file_button.clicked.connect(self.choose_model_file)
         self.toggle_generate_model_button.clicked.connect(self.change_gen_model_button_color)
         self.run_button.clicked.connect(self.run_display)
+        self.cancel_button.clicked.connect(self.cancel_session)
+
+        # Periodically drop the simulations whose window has been closed from the list
+        self.session_timer = QTimer(self)
+        self.session_timer.timeout.connect(self.reap_sessions)
+        self.session_timer.start(SESSION_POLL_INTERVAL)
 
     def change_gen_model_button_color(self):
         """Change the generate model button color to represent a toggle"""
@@ -70,7 +89,7 @@ class MyWidget(QWidget):
             self.toggle_generate_model_button.setText("Toggle Model Generation (currently off)")
 
     def run_display(self):
-        """Run the visualizer based on data from the GUI for arguments"""
+        """Run the visualizer in a new process based on data from the GUI for arguments"""
         if self.kgml_file_name != "":
             #  Define file location to save the model in and determine if application is a script file or frozen exe
             application_path = ""
@@ -81,11 +100,35 @@ class MyWidget(QWidget):
             generated_model_file_name = os.path.join(application_path, "models/" + self.model_file_edit.text() + ".txt")
             generated_model_file_name = generated_model_file_name.replace(" ", "-")
 
-            # Display the file
-            display_kgml(self.kgml_file_name,
-                         self.model_file_name,
-                         self.toggle_generate_model_button.isChecked(),
-                         generated_model_file_name)
+            # Parse, display and save the model in a child process so the GUI stays responsive
+            session = self.launcher.launch(self.kgml_file_name,
+                                           self.model_file_name,
+                                           self.toggle_generate_model_button.isChecked(),
+                                           generated_model_file_name)
+            self.sessions_list.addItem(session.label)
+
+    def refresh_sessions(self):
+        """Lists the simulations that are still running"""
+        self.sessions_list.clear()
+        for session in self.launcher.sessions:
+            self.sessions_list.addItem(session.label)
+
+    def reap_sessions(self):
+        """Removes simulations that have ended from the list"""
+        if self.launcher.reap():
+            self.refresh_sessions()
+
+    def cancel_session(self):
+        """Ends the simulation selected in the list"""
+        row = self.sessions_list.currentRow()
+        if 0 <= row < len(self.launcher.sessions):
+            self.launcher.cancel(self.launcher.sessions[row])
+            self.refresh_sessions()
+
+    def closeEvent(self, event):
+        """Ends every running simulation when the GUI is closed"""
+        self.launcher.cancel_all()
+        super().closeEvent(event)
 
     def choose_kgml_file(self):
         """Opens a file dialog to be able to choose the base kgml file"""
@@ -122,7 +165,7 @@ class MyWidget(QWidget):
             self.model_file_name, _ = QFileDialog.getOpenFileName(self,
                                                                   "Open a Network Model File",
                                                                   application_path + "/models",
-                                                                  "TXT Files (*.txt)")
+                                                                  "Model Files (*.txt *.m3b)")
             if self.model_file_name != "":
                 # If a file is selected, change the button to indicate that a model is chosen
                 self.choose_model_file_button.setStyleSheet("background-color : lightgreen")
@@ -135,10 +178,13 @@ class MyWidget(QWidget):
 
 # Run the app
 if __name__ == "__main__":
+    # Let a frozen executable start the simulation processes
+    multiprocessing.freeze_support()
+
     app = QApplication([])
 
     widget = MyWidget()
-    widget.resize(700, 200)
+    widget.resize(700, 400)
     widget.show()
 
     sys.exit(app.exec())
@@ -0,0 +1,166 @@
+"""Reads and writes the compact binary model format
+
+A binary model file is laid out as little-endian sections, each starting on an 8 byte boundary:
+    header          magic, format version, number of codes, number of edges, string table size
+    code offsets    uint64[codes + 1], where code i is string_table[offsets[i]:offsets[i + 1]]
+    string table    utf8 bytes of every code
+    values          float64[codes]
+    biases          float64[codes]
+    decays          float64[codes]
+    edge sources    uint64[edges], indices into the codes
+    edge targets    uint64[edges], indices into the codes
+    edge weights    float64[edges]
+"""
+import numpy as np
+
+MAGIC = b"M3MODEL\0"
+FORMAT_VERSION = 1
+BINARY_MODEL_EXTENSION = ".m3b"
+
+HEADER_DTYPE = np.dtype([("magic", "S8"),
+                         ("version", "<u8"),
+                         ("num_codes", "<u8"),
+                         ("num_edges", "<u8"),
+                         ("string_table_size", "<u8")])
+
+
+def _padding(size):
+    """Returns the number of bytes needed to bring size up to an 8 byte boundary"""
+    return -size % 8
+
+
+def is_binary_model(model_path):
+    """Checks the first bytes of a model file to determine if it is in the binary format
+
+    Args:
+        model_path (str): the file path of the model
+    """
+    with open(model_path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def write_binary_model(model_path, codes, values, biases, decays, edge_sources, edge_targets, edge_weights):
+    """Writes a model into a binary model file
+
+    Args:
+        model_path (str): the file path to write the model to
+        codes (list): the code of every node
+        values (array-like): the value of every node
+        biases (array-like): the bias of every node
+        decays (array-like): the decay of every node
+        edge_sources (array-like): the index of the source code of every edge
+        edge_targets (array-like): the index of the target code of every edge
+        edge_weights (array-like): the weight of every edge
+    """
+    # Pack the codes into one string table with an offset for each code
+    encoded = [code.encode("utf8") for code in codes]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+    np.cumsum([len(code) for code in encoded], out=offsets[1:])
+    string_table = b"".join(encoded)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = FORMAT_VERSION
+    header["num_codes"] = len(codes)
+    header["num_edges"] = len(edge_weights)
+    header["string_table_size"] = len(string_table)
+
+    with open(model_path, "wb") as file:
+        file.write(header.tobytes())
+        file.write(offsets.tobytes())
+        file.write(string_table + b"\0" * _padding(len(string_table)))
+        for array, dtype in ((values, "<f8"), (biases, "<f8"), (decays, "<f8"),
+                             (edge_sources, "<u8"), (edge_targets, "<u8"), (edge_weights, "<f8")):
+            file.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+
+class BinaryModel:
+    """Memory maps a binary model file, the arrays are read straight from the file without copying"""
+
+    def __init__(self, model_path):
+        self.buffer = np.memmap(model_path, dtype=np.uint8, mode="r")
+        header = self.buffer[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if bytes(header["magic"]).ljust(len(MAGIC), b"\0") != MAGIC:
+            raise ValueError(model_path + " is not a binary model file")
+        if int(header["version"]) != FORMAT_VERSION:
+            raise ValueError(model_path + " uses unsupported binary model version " + str(int(header["version"])))
+
+        num_codes = int(header["num_codes"])
+        num_edges = int(header["num_edges"])
+        string_table_size = int(header["string_table_size"])
+
+        # Walk through the sections in file order
+        position = HEADER_DTYPE.itemsize
+        self.code_offsets = self._section(position, "<u8", num_codes + 1)
+        position += 8 * (num_codes + 1)
+        self.string_table = self.buffer[position:position + string_table_size]
+        position += string_table_size + _padding(string_table_size)
+        self.values = self._section(position, "<f8", num_codes)
+        position += 8 * num_codes
+        self.biases = self._section(position, "<f8", num_codes)
+        position += 8 * num_codes
+        self.decays = self._section(position, "<f8", num_codes)
+        position += 8 * num_codes
+        self.edge_sources = self._section(position, "<u8", num_edges)
+        position += 8 * num_edges
+        self.edge_targets = self._section(position, "<u8", num_edges)
+        position += 8 * num_edges
+        self.edge_weights = self._section(position, "<f8", num_edges)
+
+    def _section(self, position, dtype, count):
+        """Returns a view of count items of dtype starting at byte position of the file"""
+        return self.buffer[position:position + 8 * count].view(dtype)
+
+    def codes(self):
+        """Decodes the string table into the list of codes"""
+        table = self.string_table.tobytes()
+        offsets = self.code_offsets.tolist()
+        return [table[start:end].decode("utf8") for start, end in zip(offsets, offsets[1:])]
+
+
+def match_keys(keys, table):
+    """Returns the position of every key in an array of distinct keys, or -1 for keys it does not hold
+
+    Args:
+        keys (np.ndarray): the keys to look up
+        table (np.ndarray): the distinct keys to find them in
+    """
+    if table.size == 0:
+        return np.full(len(keys), -1, dtype=np.intp)
+    order = np.argsort(table, kind="stable")
+    ordered = table[order]
+    found = np.minimum(np.searchsorted(ordered, keys), table.size - 1)
+    return np.where(ordered[found] == keys, order[found], -1)
+
+
+def match_model(model, codes, link_sources, link_targets):
+    """Finds the gene row of every code of a binary model and the link of every one of its edges, all at once
+
+    Args:
+        model (BinaryModel): the opened model file
+        codes (array-like): the code of every gene row of the network
+        link_sources (np.ndarray): the source row of every link of the network
+        link_targets (np.ndarray): the target row of every link of the network
+
+    Returns:
+        tuple: the gene row of every model code and the link of every model edge (-1 where nothing matched), and a
+            line describing every code or edge that matched nothing
+    """
+    model_codes = np.array(model.codes(), dtype=str)
+    code_rows = match_keys(model_codes, np.asarray(codes, dtype=str))
+
+    # Key every pair of rows by one integer so the edges are matched to the links with one search
+    size = len(codes)
+    sources = code_rows[model.edge_sources.astype(np.intp)] if model_codes.size else np.empty(0, dtype=np.intp)
+    targets = code_rows[model.edge_targets.astype(np.intp)] if model_codes.size else np.empty(0, dtype=np.intp)
+    link_keys = np.asarray(link_sources, dtype=np.int64) * size + np.asarray(link_targets, dtype=np.int64)
+    edge_links = match_keys(sources.astype(np.int64) * size + targets, link_keys)
+    edge_links[(sources < 0) | (targets < 0)] = -1
+
+    # Describe the codes and edges that matched nothing the way they were written
+    unmatched = [f"{model_codes[index]},{model.values[index]},{model.biases[index]},{model.decays[index]}"
+                 for index in np.flatnonzero(code_rows < 0).tolist()]
+    unmatched.extend(f"{model_codes[model.edge_sources[index]]},{model_codes[model.edge_targets[index]]},"
+                     f"{model.edge_weights[index]}"
+                     for index in np.flatnonzero(edge_links < 0).tolist())
+    return code_rows, edge_links, unmatched
@@ -1,5 +1,42 @@
 """Defines the foundation to create a neural network structure"""
-from math import tanh
+import warnings
+from operator import itemgetter
+
+import numpy as np
+
+from activations import DEFAULT_ACTIVATION, get_activation
+from model_format import BINARY_MODEL_EXTENSION, BinaryModel, is_binary_model, write_binary_model
+
+# The code of entries without a graphics name, which have nothing in common with each other
+NO_CODE = "n/a"
+
+# The number of conflicting pairs of codes listed in the warning about them
+LISTED_CONFLICTS = 5
+
+
+def gene_key(id_, code):
+    """Returns the key of the gene table row of an entry, its code or its own id if it has no code
+
+    Args:
+        id_ (str): the id of the entry
+        code (str): the code of the entry
+    """
+    return code if code != NO_CODE else NO_CODE + ":" + id_
+
+
+def warn_weight_conflicts(conflicts):
+    """Warns that connections between the same pair of codes have different weights, of which only one is used
+
+    Args:
+        conflicts (dict): the distinct weights of every conflicting (source key, target key) pair, the used one first
+    """
+    if not conflicts:
+        return
+    listed = ", ".join(f"{source} -> {target} {tuple(weights)}"
+                       for (source, target), weights in list(conflicts.items())[:LISTED_CONFLICTS])
+    more = f" and {len(conflicts) - LISTED_CONFLICTS} more" if len(conflicts) > LISTED_CONFLICTS else ""
+    warnings.warn(f"{len(conflicts)} pair(s) of codes are connected with different weights, only the first weight of "
+                  f"each pair is used: {listed}{more}", stacklevel=3)
 
 
 class NeuralNetwork:
@@ -7,56 +44,303 @@ class NeuralNetwork:
 
     def __init__(self):
         self.neurons = {}
+        self.group_components = {}
+        self.genes = {}
+        self.links = {}
+        self.weight_conflicts = {}
+        self.engine = None
+        self.edited_codes = set()
 
     def setup(self, model_path):
         """Sets the neural network up for computation"""
         if model_path == "":
-            # If a model path is not given, set all neuron values to 0.5
-            for neuron in self.neurons.values():
-                if len(neuron.incoming_connections) == 0:
+            # If a model path is not given, set all input values (codes without incoming connections) to 0.5
+            engine = self.compile()
+            for id_, row in zip(engine.ids, engine.rows.tolist()):
+                if engine.is_clamped[row]:
+                    neuron = self.neurons[id_]
                     neuron.is_input = True
                     neuron.value = 0.5
         else:
             # If a model path is given , use that file to generate representation
             self.input_model_file(model_path)
 
-    def propagate_net(self):
-        """Propagates the network by 1 step"""
-
-        for _ in range(1):
-
-            # Set up a visited array that is initialized all to false
-            visited = {}
-            for id_, neuron in self.neurons.items():
-                visited[id_] = False
-
-            # Iterate through all the neurons and compute their new values for the next propagation
-            for id_, neuron in self.neurons.items():
-                if visited[id_]:
-                    continue
+    def share_parameters(self):
+        """Makes every entry of a code share one canonical GeneParameters, and every connection between the same
+        pair of codes share one SharedWeight, so an edit is O(1) and duplicate entries can never drift apart
+
+        Entries without a code keep their own parameters (see gene_key). The first entry (or connection) of each
+        code keeps its parameters, the same one generate_model_file writes. Connections of a pair whose weights
+        differ are recorded in weight_conflicts and warned about, since only the first weight is simulated.
+        """
+        genes = {}
+        links = {}
+        conflicts = {}
+        for neuron in self.neurons.values():
+            neuron.parameters = genes.setdefault(neuron.key, neuron.parameters)
+        for neuron in self.neurons.values():
+            for conn in neuron.incoming_connections:
+                pair = (conn.source.key, neuron.key)
+                shared = links.setdefault(pair, conn.shared)
+                if conn.shared is not shared and conn.shared.weight != shared.weight:
+                    weights = conflicts.setdefault(pair, [shared.weight])
+                    if conn.shared.weight not in weights:
+                        weights.append(conn.shared.weight)
+                conn.shared = shared
+        self.genes = genes
+        self.links = links
+
+        # Once shared the dropped weights are gone, so conflicts are only found the first time and are kept
+        self.weight_conflicts.update(conflicts)
+        warn_weight_conflicts(conflicts)
+
+    def pack(self):
+        """Packs the canonical genes and links into arrays for CompiledNetwork
+
+        Returns:
+            dict: the neuron "ids", the gene row of every neuron ("rows"), the "codes" of the rows, their "values",
+                "biases" and "decays", and the "link_sources", "link_targets" and "link_weights" between rows
+        """
+        self.share_parameters()
+        gene_rows = {code: row for row, code in enumerate(self.genes)}
+        return {
+            "ids": list(self.neurons),
+            "rows": np.array([gene_rows[neuron.key] for neuron in self.neurons.values()], dtype=np.intp),
+            "codes": list(self.genes),
+            "values": np.array([gene.value for gene in self.genes.values()], dtype=np.float64),
+            "biases": np.array([gene.bias for gene in self.genes.values()], dtype=np.float64),
+            "decays": np.array([gene.decay for gene in self.genes.values()], dtype=np.float64),
+            "link_sources": np.array([gene_rows[source] for source, _ in self.links], dtype=np.intp),
+            "link_targets": np.array([gene_rows[target] for _, target in self.links], dtype=np.intp),
+            "link_weights": np.array([link.weight for link in self.links.values()], dtype=np.float64),
+            "activations": [gene.activation for gene in self.genes.values()],
+        }
+
+    def read_parameters(self, values, biases, decays):
+        """Copies the value, bias and decay of every canonical gene into arrays laid out like pack()"""
+        for row, gene in enumerate(self.genes.values()):
+            values[row] = gene.value
+            biases[row] = gene.bias
+            decays[row] = gene.decay
+
+    def write_values(self, values):
+        """Copies an array of values laid out like pack() back onto the canonical genes"""
+        for gene, value in zip(self.genes.values(), values.tolist()):
+            gene.value = value
+
+    def read_codes(self, codes, rows, values, biases, decays):
+        """Copies the value, bias and decay of some codes into their rows of arrays laid out like pack()"""
+        for code, row in zip(codes, rows):
+            gene = self.genes[code]
+            values[row] = gene.value
+            biases[row] = gene.bias
+            decays[row] = gene.decay
+
+    def write_codes(self, codes, rows, values):
+        """Copies the given rows of an array of values laid out like pack() back onto the genes of their codes"""
+        for code, row in zip(codes, rows):
+            self.genes[code].value = float(values[row])
+
+    def mark_edited(self, code):
+        """Records that the value, bias or decay of a code was edited, so the next incremental step picks it up
+
+        Args:
+            code (str): the code of the edited neuron (its key, see Neuron.key)
+        """
+        self.edited_codes.add(code)
+
+    def set_activation(self, code, name):
+        """Assigns a registered activation function to every entry of a code
+
+        Args:
+            code (str): the code of the neurons (their key, see Neuron.key)
+            name (str): the name of the activation (see activations.ACTIVATIONS)
+        """
+        get_activation(name)
+        self.share_parameters()
+        self.genes[code].activation = name
+        self.invalidate()
+
+    def set_type_activation(self, type_, name):
+        """Assigns a registered activation function to every neuron of a KGML entry type
+
+        Args:
+            type_ (str): the entry type, such as "gene", "compound" or "group"
+            name (str): the name of the activation (see activations.ACTIVATIONS)
+        """
+        get_activation(name)
+        for neuron in self.neurons.values():
+            if neuron.type == type_:
+                neuron.activation_type = name
+        self.invalidate()
+
+    def compile(self):
+        """Returns the compiled array form of the network, building it the first time it is needed"""
+        if self.engine is None:
+            # SciPy is only loaded once a network is actually simulated
+            from engine import CompiledNetwork
+            self.engine = CompiledNetwork(self)
+        return self.engine
+
+    def invalidate(self):
+        """Drops the compiled form of the network so that changed connections or weights are picked up"""
+        self.engine = None
+
+    def propagate_net(self, incremental=False):
+        """Propagates the network by 1 step
+
+        Args:
+            incremental (bool): only recompute the codes downstream of the codes that moved in the last step or were
+                passed to mark_edited, which makes a step proportional to the perturbed region of a large network.
+                Edits that were not reported through mark_edited are only picked up by a full step.
+        """
+        engine = self.compile()
+        if not incremental:
+            # Pick up any edits made to the neurons, step the arrays, then write the values back for the visual
+            self.edited_codes.clear()
+            engine.read_state()
+            engine.step()
+            engine.write_state()
+            return
+
+        # Only read the edited codes, unless the engine does not know which rows are settled and reads them all
+        rows = [engine.code_rows[code] for code in self.edited_codes if code in engine.code_rows]
+        self.edited_codes.clear()
+        if engine.active is None:
+            engine.read_state()
+        else:
+            self.read_codes([engine.codes[row] for row in rows], rows, engine.values, engine.biases, engine.decays)
+
+        # Step the rows that can change and only write back the values that did
+        changed = engine.step_incremental(rows).tolist()
+        self.write_codes([engine.codes[row] for row in changed], changed, engine.values)
+
+    def propagate_steps(self, steps, tolerance=None, max_period=0, trajectory=False):
+        """Propagates the network for up to a number of steps, stopping early once the values settle
+
+        Args:
+            steps (int): the maximum number of steps to propagate
+            tolerance (float): stop once no value moves more than this in one step (None always runs every step)
+            max_period (int): the longest oscillation period to watch for, 0 turns cycle detection off
+            trajectory (bool): also return the values before the first step and after every step
+
+        Returns:
+            PropagationResult: the final values, the number of steps taken and why propagation stopped
+        """
+        engine = self.compile()
+        engine.read_state()
+        result = engine.run(steps, tolerance, max_period, trajectory)
+        engine.write_state()
+        return result
+
+    def propagate_to_steady_state(self, max_steps=1000, tolerance=1e-9, max_period=8):
+        """Propagates the network until its values converge or start repeating
+
+        Args:
+            max_steps (int): give up after this many steps
+            tolerance (float): the largest per-step change that still counts as converged
+            max_period (int): the longest oscillation period to watch for
+
+        Returns:
+            PropagationResult: the final values, the number of steps taken and why propagation stopped
+        """
+        return self.propagate_steps(max_steps, tolerance, max_period)
+
+    def input_ids(self):
+        """Returns the id of the first neuron of every code without incoming connections, in network order"""
+        engine = self.compile()
+        first_ids = {}
+        for id_, row in zip(engine.ids, engine.rows.tolist()):
+            if engine.is_clamped[row]:
+                first_ids.setdefault(row, id_)
+        return list(first_ids.values())
+
+    def simulate_scenarios(self, settings, neuron_ids=None, steps=1, tolerance=None, recorder=None):
+        """Propagates many input scenarios together without changing the values held on the neurons
+
+        Args:
+            settings (array-like): a (scenarios x columns) matrix of values to hold the chosen neurons at,
+                a NaN leaves that neuron free (or at its current value if it is an input) in that scenario
+            neuron_ids (list): the neuron id of every column, standing for its whole code (defaults to the inputs)
+            steps (int): the maximum number of steps to propagate
+            tolerance (float): stop once no value in any scenario moves more than this in one step
+            recorder (TrajectoryRecorder): records the (codes x scenarios) values of every step
+
+        Returns:
+            np.ndarray: a (scenarios x codes) array of final values, columns follow the order of compile().codes
+        """
+        if neuron_ids is None:
+            neuron_ids = self.input_ids()
+        settings = np.atleast_2d(np.asarray(settings, dtype=np.float64))
+        num_scenarios = settings.shape[0]
+
+        engine = self.compile()
+        engine.read_state()
+
+        # Start every scenario from the current values, with the normal inputs held constant
+        values = np.repeat(engine.values[:, np.newaxis], num_scenarios, axis=1)
+        clamped = np.repeat(engine.is_clamped[:, np.newaxis], num_scenarios, axis=1)
+
+        # Overwrite and hold the chosen neurons in every scenario that sets them
+        rows = np.array([engine.index[id_] for id_ in neuron_ids], dtype=np.intp)
+        is_set = ~np.isnan(settings.T)
+        values[rows] = np.where(is_set, settings.T, values[rows])
+        clamped[rows] |= is_set
+
+        engine.run_batch(values, clamped, steps, tolerance, recorder)
+        return np.ascontiguousarray(values.T)
+
+    def knockout_scenarios(self, codes=None):
+        """Builds a settings matrix that knocks out one gene code per scenario
+
+        Args:
+            codes (list): the codes to knock out (defaults to every code in the network)
+
+        Returns:
+            tuple: the (scenarios x codes) settings matrix, a neuron id of every column and the code of every row
+        """
+        engine = self.compile()
+        if codes is None:
+            codes = engine.codes
+
+        # Each scenario holds its own code at 0 and leaves every other code free
+        first_ids = {}
+        for id_, row in zip(engine.ids, engine.rows.tolist()):
+            first_ids.setdefault(engine.codes[row], id_)
+        neuron_ids = [first_ids[code] for code in codes]
+        settings = np.full((len(codes), len(codes)), np.nan)
+        np.fill_diagonal(settings, 0.0)
+        return settings, neuron_ids, codes
 
-                visited[id_] = True
+    def input_model_file(self, model_path):
+        """Sets the neural network up based on given model file, in either the text or the binary format
 
-                # Add up the computations of all the inputting neurons to determine effect and process decay
-                connection_sum = 0
-                for conn in neuron.incoming_connections:
-                    connection_sum += conn.source.value * conn.weight
-                connection_sum += neuron.bias
-                connection_sum += neuron.value/neuron.decay
+        Args:
+            model_path (str): A string that is the file path to a txt or binary model file
 
-                # Use Activation Function on the sum of all input computations
-                neuron.next_propagation_value = neuron.activation_function(connection_sum)
+        Returns:
+            list: the model lines that matched no neuron or connection in the network
+        """
+        # Index the network once by code so every model line is matched in constant time
+        self.share_parameters()
 
-                # If node is an input value, hold the value constant (it is an environment variable)
-                if len(neuron.incoming_connections) == 0:
-                    neuron.next_propagation_value = neuron.value
+        if is_binary_model(model_path):
+            unmatched = self._input_binary_model(model_path)
+        else:
+            unmatched = self._input_text_model(model_path, self.genes, self.links)
+        self.invalidate()
 
-            # Puts in the newly computed values into the existing network
-            for id_, neuron in self.neurons.items():
-                neuron.value = neuron.next_propagation_value
+        # Report the lines that did not match anything instead of silently dropping them
+        if unmatched:
+            print(f"{len(unmatched)} line(s) of {model_path} matched nothing in the network:")
+            for text in unmatched:
+                print("    " + text)
+        return unmatched
 
-    def input_model_file(self, model_path):
-        """Sets the neural network up based on given model file"""
+    @staticmethod
+    def _input_text_model(model_path, genes, links):
+        """Applies a text model file to the canonical tables, returning the lines that matched nothing"""
+        unmatched = []
 
         file = open(model_path, "r", encoding="utf8")
 
@@ -64,12 +348,15 @@ class NeuralNetwork:
         num_vals = int(file.readline())
         file.readline()
         for _ in range(num_vals):
-            line = file.readline().split(",")
+            text = file.readline()
+            line = text.split(",")
 
-            for neuron in self.neurons.values():
-                if neuron.code == line[0]:
-                    neuron.value = float(line[1])
-                    neuron.bias = float(line[2])
+            gene = genes.get(line[0])
+            if gene is None:
+                unmatched.append(text.rstrip("\n"))
+            else:
+                gene.value = float(line[1])
+                gene.bias = float(line[2])
 
         file.readline()
 
@@ -77,57 +364,177 @@ class NeuralNetwork:
         num_conns = int(file.readline())
         file.readline()
         for _ in range(num_conns):
-            line = file.readline().split(",")
+            text = file.readline()
+            line = text.split(",")
 
-            for neuron in self.neurons.values():
-                if neuron.code == line[1]:
-                    for conn in neuron.incoming_connections:
-                        if conn.source.code == line[0]:
-                            conn.weight = float(line[2])
+            link = links.get((line[0], line[1]))
+            if link is None:
+                unmatched.append(text.rstrip("\n"))
+            else:
+                link.weight = float(line[2])
 
         file.close()
+        return unmatched
+
+    def _input_binary_model(self, model_path):
+        """Applies a binary model file to the canonical tables, returning the entries that matched nothing
+
+        A model written from the same tables lists its codes and edges in table order. That is checked by comparing
+        the lists once, after which the parameters are set in order without looking up a single code.
+        """
+        unmatched = []
+        model = BinaryModel(model_path)
+        codes = model.codes()
+
+        # Use the codes of the tables themselves when they are the same, so the edges below compare by identity
+        if codes == list(self.genes):
+            codes = list(self.genes)
+            genes = self.genes.values()
+        else:
+            genes = map(self.genes.get, codes)
+
+        # Set the values, biases and decays of the nodes
+        for gene, code, value, bias, decay in zip(genes, codes, model.values.tolist(), model.biases.tolist(),
+                                                  model.decays.tolist()):
+            if gene is None:
+                unmatched.append(f"{code},{value},{bias},{decay}")
+            else:
+                gene.value = value
+                gene.bias = bias
+                gene.decay = decay
+
+        # Look up the codes of both ends of every edge at once
+        code_table = np.array(codes, dtype=object)
+        sources = code_table[model.edge_sources.astype(np.intp)].tolist()
+        targets = code_table[model.edge_targets.astype(np.intp)].tolist()
+        if list(map(itemgetter(0), self.links)) == sources and list(map(itemgetter(1), self.links)) == targets:
+            links = self.links.values()
+        else:
+            links = map(self.links.get, zip(sources, targets))
 
-    def generate_model_file(self, generated_model_file_name):
-        """Generate a model file based on a neural network"""
+        # Set the weights of the connections between nodes
+        for link, source, target, weight in zip(links, sources, targets, model.edge_weights.tolist()):
+            if link is None:
+                unmatched.append(f"{source},{target},{weight}")
+            else:
+                link.weight = weight
 
-        file = open(generated_model_file_name, "w", encoding="utf8")
+        return unmatched
 
-        # Generate a list of neurons and their values/biases
-        file_string = ""
-        neuron_codes = set()
-        neurons_string = ""
-        for neuron in self.neurons.values():
-            if not neuron.code in neuron_codes:
-                neurons_string += (neuron.code + ","
-                                   + str(neuron.value) + ","
-                                   + str(neuron.bias) + ",\n")
-                neuron_codes.add(neuron.code)
-
-        # Generate a list of connections and their weights
-        conn_weights = {}
-        for neuron in self.neurons.values():
+    def to_arrays(self):
+        """Packs the structure and state of the network into a dict of arrays
+
+        Connections are listed target by target in the order of each target's incoming connections.
+        """
+        neurons = list(self.neurons.values())
+        index = {neuron.id_: ind for ind, neuron in enumerate(neurons)}
+
+        edge_sources = []
+        edge_targets = []
+        edge_weights = []
+        for ind, neuron in enumerate(neurons):
             for conn in neuron.incoming_connections:
-                conn_weights[conn.source.code + "," + conn.target.code] = conn.weight
+                edge_sources.append(index[conn.source.id_])
+                edge_targets.append(ind)
+                edge_weights.append(conn.weight)
+
+        return {
+            "ids": np.array([neuron.id_ for neuron in neurons], dtype=str),
+            "names": np.array([neuron.name for neuron in neurons], dtype=str),
+            "types": np.array([neuron.type for neuron in neurons], dtype=str),
+            "codes": np.array([neuron.code for neuron in neurons], dtype=str),
+            "positions": np.array([neuron.pos for neuron in neurons], dtype=np.int64).reshape(-1, 2),
+            "values": np.array([neuron.value for neuron in neurons], dtype=np.float64),
+            "biases": np.array([neuron.bias for neuron in neurons], dtype=np.float64),
+            "decays": np.array([neuron.decay for neuron in neurons], dtype=np.float64),
+            "edge_sources": np.array(edge_sources, dtype=np.int64),
+            "edge_targets": np.array(edge_targets, dtype=np.int64),
+            "edge_weights": np.array(edge_weights, dtype=np.float64),
+            "group_rows": np.array([index[group_id] for group_id, component_ids in self.group_components.items()
+                                    for _ in component_ids], dtype=np.int64),
+            "component_rows": np.array([index[component_id] for component_ids in self.group_components.values()
+                                        for component_id in component_ids], dtype=np.int64),
+        }
+
+    @staticmethod
+    def from_arrays(arrays):
+        """Rebuilds a network from the dict of arrays made by to_arrays
+
+        Args:
+            arrays (dict): the arrays describing the network (an opened npz file works too)
+        """
+        network = NeuralNetwork()
+        neurons = []
+        for id_, name, type_, code, pos, value, bias, decay in zip(arrays["ids"].tolist(),
+                                                                    arrays["names"].tolist(),
+                                                                    arrays["types"].tolist(),
+                                                                    arrays["codes"].tolist(),
+                                                                    arrays["positions"].tolist(),
+                                                                    arrays["values"].tolist(),
+                                                                    arrays["biases"].tolist(),
+                                                                    arrays["decays"].tolist()):
+            neuron = Neuron(id_, name, type_, tuple(pos), code)
+            neuron.value = value
+            neuron.bias = bias
+            neuron.decay = decay
+            network.neurons[id_] = neuron
+            neurons.append(neuron)
+
+        for source, target, weight in zip(arrays["edge_sources"].tolist(),
+                                          arrays["edge_targets"].tolist(),
+                                          arrays["edge_weights"].tolist()):
+            neurons[source].connect(neurons[target], weight)
+
+        for group_row, component_row in zip(arrays["group_rows"].tolist(), arrays["component_rows"].tolist()):
+            network.group_components.setdefault(neurons[group_row].id_, []).append(neurons[component_row].id_)
+
+        network.share_parameters()
+        return network
+
+    def generate_model_file(self, generated_model_file_name):
+        """Generate a model file based on a neural network, binary if the name ends in the binary extension"""
+
+        # Write the canonical parameters of every code and the weight of every pair of codes
+        self.share_parameters()
+        nodes = self.genes
+        conn_weights = {codes: link.weight for codes, link in self.links.items()}
+
+        if generated_model_file_name.endswith(BINARY_MODEL_EXTENSION):
+            # Write the model as arrays indexed by code position
+            codes = list(nodes)
+            positions = {code: ind for ind, code in enumerate(codes)}
+            write_binary_model(generated_model_file_name,
+                               codes,
+                               [neuron.value for neuron in nodes.values()],
+                               [neuron.bias for neuron in nodes.values()],
+                               [neuron.decay for neuron in nodes.values()],
+                               [positions[source] for source, _ in conn_weights],
+                               [positions[target] for _, target in conn_weights],
+                               list(conn_weights.values()))
+            return
+
+        # Generate a list of neurons and their values/biases and a list of connections and their weights
+        lines = [str(len(nodes)) + "\n", "code val bias" + "\n"]
+        for code, neuron in nodes.items():
+            lines.append(code + "," + str(neuron.value) + "," + str(neuron.bias) + ",\n")
+        lines.append("\n")
+        lines.append(str(len(conn_weights)) + "\n")
+        lines.append("src target weight" + "\n")
+        for (source, target), weight in conn_weights.items():
+            lines.append(source + "," + target + "," + str(weight) + ",\n")
 
         # Print generated output
-        file_string += (str(len(neuron_codes)) + "\n")
-        file_string += ("code val bias" + "\n")
-        file_string += neurons_string
-        file_string += ("\n")
-        file_string += (str(len(conn_weights)) + "\n")
-        file_string += ("src target weight" + "\n")
-
-        # Print connections list
-        for conn_description, weight in conn_weights.items():
-            file_string += (conn_description + "," + str(weight) + ",\n")
-
-        file.write(file_string)
+        file = open(generated_model_file_name, "w", encoding="utf8")
+        file.write("".join(lines))
         file.close()
 
 
 class Neuron:
     """Can compute values and connect with other Neurons"""
 
+    __slots__ = ("id_", "name", "type", "outgoing_connections", "incoming_connections", "pos", "code", "is_input",
+                 "parameters")
+
     def __init__(self, id_, name, type_, pos, code):
         # Define properties useful for general purpose handling
         self.id_ = id_
@@ -136,15 +543,52 @@ class Neuron:
         self.outgoing_connections = []
         self.incoming_connections = []
         self.pos = pos
-        self.next_propagation_value = 1
         self.code = code
         self.is_input = False
 
-        # Define properties useful for calculation
-        self.decay = 2.0
-        self.value = 0.5
-        self.bias = 0.0
-        self.activation_type = "tanh(relu())"
+        # Define properties useful for calculation (shared by every entry of the code, see share_parameters)
+        self.parameters = GeneParameters()
+
+    @property
+    def key(self):
+        """The key of the neuron's gene table row, its code unless it has none (see gene_key)"""
+        return gene_key(self.id_, self.code)
+
+    @property
+    def value(self):
+        """The current value of the neuron's code"""
+        return self.parameters.value
+
+    @value.setter
+    def value(self, value):
+        self.parameters.value = value
+
+    @property
+    def activation_type(self):
+        """The name of the activation function of the neuron's code"""
+        return self.parameters.activation
+
+    @activation_type.setter
+    def activation_type(self, name):
+        self.parameters.activation = get_activation(name).name
+
+    @property
+    def bias(self):
+        """The bias of the neuron's code"""
+        return self.parameters.bias
+
+    @bias.setter
+    def bias(self, bias):
+        self.parameters.bias = bias
+
+    @property
+    def decay(self):
+        """The decay of the neuron's code"""
+        return self.parameters.decay
+
+    @decay.setter
+    def decay(self, decay):
+        self.parameters.decay = decay
 
     def connect(self, target_neuron, weight):
         """Connects Neuron with another Neuron"""
@@ -154,14 +598,45 @@ class Neuron:
 
     def activation_function(self, connection_sum):
         """Non-linearly transforms the sum of connections in the neuron"""
-        # Define the activation function as tanh(relu())
-        return tanh(max(0, connection_sum))
+        return get_activation(self.activation_type).scalar(connection_sum)
 
 
 class Connection:
     """Can connect two Neurons"""
 
+    __slots__ = ("source", "target", "shared")
+
     def __init__(self, source, target, weight):
         self.source = source
         self.target = target
-        self.weight = float(weight)
+        self.shared = SharedWeight(float(weight))
+
+    @property
+    def weight(self):
+        """The weight shared by every connection between the same pair of codes"""
+        return self.shared.weight
+
+    @weight.setter
+    def weight(self, weight):
+        self.shared.weight = weight
+
+
+class GeneParameters:
+    """Holds the value, bias and decay of one code, every entry of that code refers to the same instance"""
+
+    __slots__ = ("value", "bias", "decay", "activation")
+
+    def __init__(self, value=0.5, bias=0.0, decay=2.0, activation=DEFAULT_ACTIVATION):
+        self.value = value
+        self.bias = bias
+        self.decay = decay
+        self.activation = activation
+
+
+class SharedWeight:
+    """Holds the weight of one pair of codes, every connection between that pair refers to the same instance"""
+
+    __slots__ = ("weight",)
+
+    def __init__(self, weight):
+        self.weight = weight
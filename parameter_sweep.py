@@ -0,0 +1,245 @@
+"""Sweeps the values, biases, decays and weights of a network across a grid, sharing the work between processes
+
+The compiled arrays of the network are placed once in shared memory, so worker processes build their engine from
+them instead of receiving a pickled graph of neurons.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from engine import CompiledNetwork
+
+# The parameters an axis can sweep (the same fields input_model_file sets) and the engine array each one lives in
+GENE_PARAMETERS = {"value": "values", "bias": "biases", "decay": "decays"}
+WEIGHT_PARAMETER = "weight"
+
+# The packed arrays copied into shared memory for the workers
+SHARED_ARRAYS = ("values", "biases", "decays", "link_sources", "link_targets", "link_weights", "activation_ids")
+
+# The engine and grid of a worker process, set up once by _attach
+_worker = {}
+
+
+class SweepChunk:
+    """Holds the results of a consecutive run of grid points"""
+
+    def __init__(self, start, parameters, values, steps):
+        self.start = start
+        self.parameters = parameters
+        self.values = values
+        self.steps = steps
+
+
+def grid_shape(axes):
+    """Returns the number of values of every axis of a grid
+
+    Args:
+        axes (list): (parameter, values) pairs, see sweep
+    """
+    return tuple(len(values) for _, values in axes)
+
+
+def grid_indices(shape, start, stop):
+    """Returns the index along every axis of a consecutive run of grid points
+
+    Args:
+        shape (tuple): the number of values of every axis
+        start (int): the first grid point
+        stop (int): the grid point after the last one
+    """
+    if not shape:
+        # A grid without axes has one point, the network as it is
+        return ()
+    return np.unravel_index(np.arange(start, stop), shape)
+
+
+def grid_parameters(axes, start, stop):
+    """Returns the parameter values of a consecutive run of grid points, one column per axis
+
+    Args:
+        axes (list): (parameter, values) pairs, see sweep
+        start (int): the first grid point
+        stop (int): the grid point after the last one
+    """
+    indices = grid_indices(grid_shape(axes), start, stop)
+    columns = [np.asarray(values, dtype=np.float64)[index] for (_, values), index in zip(axes, indices)]
+    return np.column_stack(columns) if columns else np.empty((stop - start, 0))
+
+
+def resolve_axes(engine, axes):
+    """Turns every axis into the engine array and position it sets
+
+    Args:
+        engine (CompiledNetwork): the compiled network
+        axes (list): (parameter, values) pairs, see sweep
+
+    Returns:
+        list: ("values"/"biases"/"decays"/"weights", position, values array) for every axis
+    """
+    rows = engine.code_rows
+    resolved = []
+    for parameter, values in axes:
+        kind = parameter[0]
+        if kind in GENE_PARAMETERS:
+            if parameter[1] not in rows:
+                raise KeyError(parameter[1])
+            resolved.append((GENE_PARAMETERS[kind], rows[parameter[1]], np.asarray(values, dtype=np.float64)))
+        elif kind == WEIGHT_PARAMETER:
+            position = engine.link_position(rows[parameter[1]], rows[parameter[2]])
+            if position is None:
+                raise KeyError(parameter[1:])
+            resolved.append(("weights", position, np.asarray(values, dtype=np.float64)))
+        else:
+            raise ValueError("Unknown sweep parameter " + repr(kind) + ", choose one of "
+                             + ", ".join(list(GENE_PARAMETERS) + [WEIGHT_PARAMETER]))
+    return resolved
+
+
+def share_arrays(arrays):
+    """Copies arrays into one new shared memory block, each starting on an 8 byte boundary
+
+    Args:
+        arrays (dict): the arrays to share by name
+
+    Returns:
+        tuple: the SharedMemory block and its layout, a list of (name, dtype, shape, offset)
+    """
+    layout = []
+    size = 0
+    for name, array in arrays.items():
+        layout.append((name, array.dtype.str, array.shape, size))
+        size += (array.nbytes + 7) // 8 * 8
+    block = shared_memory.SharedMemory(create=True, size=max(size, 8))
+    for (name, dtype, shape, offset), array in zip(layout, arrays.values()):
+        np.ndarray(shape, dtype, block.buf, offset)[...] = array
+    return block, layout
+
+
+def _attach(block_name, layout, activation_names, resolved, steps, tolerance):
+    """Builds the engine of a worker process from the shared arrays"""
+    block = shared_memory.SharedMemory(name=block_name)
+    shared = {name: np.ndarray(shape, dtype, block.buf, offset) for name, dtype, shape, offset in layout}
+    size = shared["values"].size
+
+    # The state is copied as every grid point edits it, the link arrays are only read while building the matrix
+    packed = {
+        "ids": range(size),
+        "rows": np.arange(size),
+        "codes": range(size),
+        "values": shared["values"].copy(),
+        "biases": shared["biases"].copy(),
+        "decays": shared["decays"].copy(),
+        "link_sources": shared["link_sources"],
+        "link_targets": shared["link_targets"],
+        "link_weights": shared["link_weights"],
+        "activations": [activation_names[id_] for id_ in shared["activation_ids"].tolist()],
+    }
+    engine = CompiledNetwork(None, packed)
+    arrays = {"values": engine.values, "biases": engine.biases, "decays": engine.decays,
+              "weights": engine.weights.data}
+
+    _worker.update(block=block,
+                   engine=engine,
+                   initial=shared["values"],
+                   axes=[(arrays[kind], position, values) for kind, position, values in resolved],
+                   shape=tuple(len(values) for _, _, values in resolved),
+                   steps=steps,
+                   tolerance=tolerance)
+
+
+def _run_chunk(start, stop):
+    """Propagates a consecutive run of grid points in a worker process"""
+    engine = _worker["engine"]
+    axes = _worker["axes"]
+    values = np.empty((stop - start, engine.values.size))
+    steps = np.empty(stop - start, dtype=np.int64)
+    indices = grid_indices(_worker["shape"], start, stop)
+
+    for point in range(stop - start):
+        # Every point starts from the initial values with its own parameters set
+        engine.values[:] = _worker["initial"]
+        for (array, position, axis_values), axis_indices in zip(axes, indices):
+            array[position] = axis_values[axis_indices[point]]
+
+        result = engine.run(_worker["steps"], _worker["tolerance"])
+        values[point] = result.values
+        steps[point] = result.steps
+    return values, steps
+
+
+def sweep(network, axes, steps=1, tolerance=None, workers=None, chunk_size=256, progress=None):
+    """Propagates the network once for every point of a grid of parameters, yielding the results in grid order
+
+    The grid holds every combination of the axis values, the last axis varying fastest. Every point starts from the
+    current state of the network, parameters not on an axis keep their current value. Activations registered at
+    runtime must also be registered when the worker processes import their module.
+
+    Args:
+        network (NeuralNetwork): the network to sweep
+        axes (list): (parameter, values) pairs, where parameter is ("value", code), ("bias", code), ("decay", code)
+            or ("weight", source code, target code)
+        steps (int): the maximum number of steps to propagate every point
+        tolerance (float): stop a point once no value moves more than this in one step
+        workers (int): the number of worker processes (defaults to one per CPU)
+        chunk_size (int): the number of grid points handed to a worker at a time
+        progress (function): called with (points done, total points) each time a chunk is yielded
+
+    Yields:
+        SweepChunk: the first grid point of the chunk, its (points x axes) parameters, the (points x codes) final
+            values (columns follow network.compile().codes) and the steps taken by every point
+    """
+    engine = network.compile()
+    engine.read_state()
+    resolved = resolve_axes(engine, axes)
+    total = int(np.prod(grid_shape(axes), dtype=np.int64))
+    workers = workers or os.cpu_count() or 1
+
+    # Share the packed network, the activations are sent by id so only their distinct names are pickled
+    packed = network.pack()
+    activation_names = list(dict.fromkeys(packed["activations"]))
+    ids = {name: id_ for id_, name in enumerate(activation_names)}
+    packed["activation_ids"] = np.array([ids[name] for name in packed["activations"]], dtype=np.intp)
+    block, layout = share_arrays({name: np.ascontiguousarray(packed[name]) for name in SHARED_ARRAYS})
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_attach,
+                                 initargs=(block.name, layout, activation_names, resolved, steps,
+                                           tolerance)) as executor:
+            # Keep a few chunks per worker in flight and hand them back in the order of the grid
+            pending = deque()
+            next_start = 0
+            done = 0
+            while next_start < total or pending:
+                while next_start < total and len(pending) < 2 * workers:
+                    stop = min(next_start + chunk_size, total)
+                    pending.append((next_start, stop, executor.submit(_run_chunk, next_start, stop)))
+                    next_start = stop
+
+                start, stop, future = pending.popleft()
+                values, taken = future.result()
+                done += stop - start
+                if progress is not None:
+                    progress(done, total)
+                yield SweepChunk(start, grid_parameters(axes, start, stop), values, taken)
+    finally:
+        block.close()
+        block.unlink()
+
+
+def run_sweep(network, axes, **options):
+    """Sweeps a grid of parameters and gathers every result (see sweep for the arguments)
+
+    Returns:
+        tuple: the (points x axes) parameters, the (points x codes) final values and the steps of every point
+    """
+    chunks = list(sweep(network, axes, **options))
+    if not chunks:
+        size = len(network.compile().codes)
+        return np.empty((0, len(axes))), np.empty((0, size)), np.empty(0, dtype=np.int64)
+    return (np.concatenate([chunk.parameters for chunk in chunks]),
+            np.concatenate([chunk.values for chunk in chunks]),
+            np.concatenate([chunk.steps for chunk in chunks]))
@@ -0,0 +1,122 @@
+"""Caches parsed KGML pathways on disk so re-opening a pathway skips XML parsing"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from compact_network import CompactNetwork
+from kgml_parser import RELATION_MAPPING_VERSION, parse_kgml
+from networking import NeuralNetwork
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "MetabolismModelMaker", "pathways")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+CACHE_EXTENSION = ".npz"
+
+# Bump whenever the arrays stored for a network change
+CACHE_FORMAT_VERSION = 2
+
+
+def file_hash(file_path):
+    """Returns the sha256 hex digest of the contents of a file
+
+    Args:
+        file_path (str): the filepath
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PathwayCache:
+    """Stores compiled networks as arrays plus a code table, keyed by KGML content and parser version
+
+    Networks are rebuilt as NeuralNetworks, or as array-backed CompactNetworks when compact is set. Entries for an
+    old file content or an old relation mapping are simply never looked up again, and the least
+    recently used entries are deleted once the cache grows past its size cap.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, compact=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.compact = compact
+
+    def key(self, kgml_path):
+        """Returns the cache key of a KGML file
+
+        Args:
+            kgml_path (str): A string that is the file path to a xml KGML file
+        """
+        return file_hash(kgml_path) + "-v" + str(RELATION_MAPPING_VERSION) + "-f" + str(CACHE_FORMAT_VERSION)
+
+    def entry_path(self, key):
+        """Returns the file that holds the cache entry for a key"""
+        return os.path.join(self.cache_dir, key + CACHE_EXTENSION)
+
+    def get(self, key):
+        """Returns the cached network for a key, or None if it is not cached"""
+        path = self.entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as arrays:
+                if self.compact:
+                    network = CompactNetwork(arrays)
+                else:
+                    network = NeuralNetwork.from_arrays(arrays)
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return network
+
+    def put(self, key, network):
+        """Stores a network under a key, then evicts old entries beyond the size cap"""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            # Write to a temporary file first so a half-written entry is never read
+            handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(handle, "wb") as file:
+                np.savez(file, **network.to_arrays())
+            os.replace(temp_path, self.entry_path(key))
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits within its size cap"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(CACHE_EXTENSION):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            total -= size
+
+    def load(self, kgml_path):
+        """Returns the network of a KGML file, parsing it only if it is not already cached
+
+        Args:
+            kgml_path (str): A string that is the file path to a xml KGML file
+        """
+        key = self.key(kgml_path)
+        network = self.get(key)
+        if network is None:
+            network = parse_kgml(kgml_path)
+            self.put(key, network)
+            if self.compact:
+                network = CompactNetwork(network.to_arrays())
+        return network
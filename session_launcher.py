@@ -0,0 +1,97 @@
+"""Runs visualizer sessions in child processes, so the window that launches them stays responsive"""
+import multiprocessing
+import os
+
+
+def run_session(kgml_path, model_path, is_generating_model, generated_model_file_name):
+    """Parses, displays and optionally saves a model of a KGML file, the entry point of a session process
+
+    Args:
+        kgml_path (str): A string that is the file path to a xml KGML file
+        model_path (str): A string that is the file path to a txt model file
+        is_generating_model (bool): Determines if the session will make a model file
+        generated_model_file_name (str): The name of the file that will store your generated model
+    """
+    # Load the visualizer (pygame, the NumPy engine and the KGML parser) only in the child process
+    from create_visual import display_kgml
+    display_kgml(kgml_path, model_path, is_generating_model, generated_model_file_name)
+
+
+class Session:
+    """A visualizer running in its own process"""
+
+    def __init__(self, process, kgml_path, model_path):
+        self.process = process
+        self.kgml_path = kgml_path
+        self.model_path = model_path
+
+    @property
+    def is_running(self):
+        """Whether the process has not exited yet"""
+        return self.process.is_alive()
+
+    @property
+    def label(self):
+        """A short description of the session for a list of sessions"""
+        text = os.path.basename(self.kgml_path)
+        if self.model_path:
+            text += " + " + os.path.basename(self.model_path)
+        return text + " (pid " + str(self.process.pid) + ")"
+
+
+class SessionLauncher:
+    """Starts, tracks and cancels visualizer sessions
+
+    Sessions are started with the spawn method, so a child never inherits the Qt or pygame state of the parent.
+    """
+
+    def __init__(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.sessions = []
+
+    def launch(self, kgml_path, model_path, is_generating_model, generated_model_file_name):
+        """Starts a session in a new process (see run_session for the arguments)
+
+        Returns:
+            Session: the started session
+        """
+        process = self.context.Process(target=run_session,
+                                       args=(kgml_path, model_path, is_generating_model, generated_model_file_name),
+                                       daemon=True)
+        process.start()
+        session = Session(process, kgml_path, model_path)
+        self.sessions.append(session)
+        return session
+
+    def cancel(self, session, timeout=2.0):
+        """Ends a session, killing it if it does not exit in time
+
+        Args:
+            session (Session): the session to end
+            timeout (float): the number of seconds to wait after asking the process to terminate
+        """
+        if session.is_running:
+            session.process.terminate()
+            session.process.join(timeout)
+            if session.is_running:
+                session.process.kill()
+                session.process.join()
+        if session in self.sessions:
+            self.sessions.remove(session)
+
+    def cancel_all(self):
+        """Ends every session"""
+        for session in list(self.sessions):
+            self.cancel(session)
+
+    def reap(self):
+        """Forgets the sessions whose process has exited
+
+        Returns:
+            list: the finished sessions
+        """
+        finished = [session for session in self.sessions if not session.is_running]
+        for session in finished:
+            session.process.join()
+            self.sessions.remove(session)
+        return finished
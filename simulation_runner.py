@@ -0,0 +1,286 @@
+"""Propagates a network in a background thread so a window drawing it stays responsive"""
+import threading
+import time
+
+import numpy as np
+
+from engine import CompiledNetwork
+
+
+def detached_pack(network):
+    """Returns a copy of the packed arrays of a network that later edits to the network do not change
+
+    Args:
+        network (NeuralNetwork): the network to pack
+    """
+    packed = network.pack()
+    for name in ("rows", "values", "biases", "decays", "link_sources", "link_targets", "link_weights"):
+        packed[name] = np.array(packed[name], copy=True)
+    packed["ids"] = list(packed["ids"])
+    packed["codes"] = list(packed["codes"])
+    packed["activations"] = list(packed["activations"])
+    return packed
+
+
+class BackgroundSimulation:
+    """Steps a private compiled copy of a network in a worker thread and publishes its values as snapshots
+
+    The worker writes every new set of values into a back buffer and swaps it with the front buffer under a lock, so
+    the thread that owns the network only ever sees complete steps. That thread calls apply_latest to copy the
+    newest snapshot onto the network. After editing the network it calls send_edits or send_weight, which hand the
+    worker only the edited numbers to patch into its engine, or reload after changing the structure of the network.
+    Snapshots computed before an edit are dropped, the worker publishes its state with the edit applied instead.
+    Every published state can also be kept in a TrajectoryRecorder, including steps the window never showed.
+    """
+
+    def __init__(self, network, steps_per_second=10.0, on_snapshot=None, recorder=None):
+        self.network = network
+        self.steps_per_second = steps_per_second
+        self.on_snapshot = on_snapshot
+        self.recorder = recorder
+        self.steps_taken = 0
+
+        self._condition = threading.Condition()
+        self._packed = detached_pack(network)
+        self._edited_rows = None
+        self._rows = dict(zip(self._packed["codes"], range(len(self._packed["codes"]))))
+        self._parameter_edits = {}
+        self._weight_edits = {}
+        self._epoch = 0
+        self._pending_steps = 0
+        self._playing = False
+        self._stopping = False
+
+        # The front buffer holds the newest complete step, the worker fills the back buffer
+        size = len(self._packed["codes"])
+        self._buffers = [np.empty(size), np.empty(size)]
+        self._front = 0
+        self._generation = 0
+        self._applied_generation = 0
+        self._snapshot_epoch = 0
+        self._snapshot_steps = 0
+        self._notified = False
+
+        self._thread = threading.Thread(target=self._run, name="simulation", daemon=True)
+
+    @property
+    def is_playing(self):
+        """Whether the network is being propagated continuously"""
+        return self._playing
+
+    @property
+    def pending_steps(self):
+        """The number of requested single steps that have not been taken yet"""
+        return self._pending_steps
+
+    def start(self):
+        """Starts the worker thread"""
+        self._thread.start()
+
+    def stop(self):
+        """Stops continuous propagation, lets the worker finish the requested steps, then ends it"""
+        with self._condition:
+            self._playing = False
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def request_steps(self, count=1):
+        """Asks the worker to propagate the network by a number of steps"""
+        with self._condition:
+            self._pending_steps += count
+            self._condition.notify_all()
+
+    def play(self):
+        """Propagates the network continuously at steps_per_second"""
+        with self._condition:
+            self._playing = True
+            self._condition.notify_all()
+
+    def pause(self):
+        """Stops continuous propagation after the current step"""
+        with self._condition:
+            self._playing = False
+            self._condition.notify_all()
+
+    def set_rate(self, steps_per_second):
+        """Changes the number of steps taken per second while playing, None runs as fast as possible"""
+        with self._condition:
+            self.steps_per_second = steps_per_second
+            self._condition.notify_all()
+
+    def reload(self):
+        """Has the worker rebuild its engine from the network before its next step, discarding older snapshots
+
+        Only needed after codes or connections were added or removed, send_edits and send_weight are much cheaper
+        for edited numbers. The worker takes the biases, decays and weights of the network, but keeps the values it
+        has reached except for the codes passed to the network's mark_edited, so steps still being taken are not lost.
+        """
+        packed = detached_pack(self.network)
+        rows = dict(zip(packed["codes"], range(len(packed["codes"]))))
+        edited_rows = np.array([rows[code] for code in self.network.edited_codes if code in rows], dtype=np.intp)
+        self.network.edited_codes.clear()
+        self._rows = rows
+        with self._condition:
+            # Edits made since an earlier reload that the worker has not picked up yet still count
+            if self._packed is not None and self._edited_rows is not None:
+                edited_rows = np.union1d(edited_rows, self._edited_rows)
+            self._packed = packed
+            self._edited_rows = edited_rows
+            self._epoch += 1
+            self._condition.notify_all()
+
+    def send_edits(self):
+        """Has the worker pick up the value, bias and decay of the codes passed to the network's mark_edited
+
+        Only the numbers of those codes are copied, the worker writes them into its engine before its next step and
+        recomputes the rows they affect, discarding older snapshots.
+        """
+        codes = [code for code in self.network.edited_codes if code in self._rows]
+        self.network.edited_codes.clear()
+        rows = np.array([self._rows[code] for code in codes], dtype=np.intp)
+
+        # Read the codes into arrays laid out like pack(), which both kinds of network fill the same way
+        size = len(self._rows)
+        values, biases, decays = np.empty(size), np.empty(size), np.empty(size)
+        self.network.read_codes(codes, rows, values, biases, decays)
+        with self._condition:
+            self._parameter_edits.update(zip(codes, zip(values[rows].tolist(), biases[rows].tolist(),
+                                                        decays[rows].tolist())))
+            self._epoch += 1
+            self._condition.notify_all()
+
+    def send_weight(self, source_code, target_code, weight):
+        """Has the worker patch the weight from one code to another into its engine before its next step
+
+        Args:
+            source_code (str): the code the connection starts at
+            target_code (str): the code the connection ends at
+            weight (float): the new weight
+        """
+        with self._condition:
+            self._weight_edits[source_code, target_code] = weight
+            self._epoch += 1
+            self._condition.notify_all()
+
+    def apply_latest(self, force=False):
+        """Copies the newest snapshot onto the network, call it from the thread that reads the network
+
+        Args:
+            force (bool): copy the snapshot even if it was applied already, such as after showing a recorded step
+
+        Returns:
+            bool: whether the network changed
+        """
+        with self._condition:
+            self._notified = False
+            if self._generation == 0 or self._generation == self._applied_generation and not force:
+                return False
+            self._applied_generation = self._generation
+            if self._snapshot_epoch != self._epoch:
+                return False
+            self.network.write_values(self._buffers[self._front])
+            self.steps_taken = self._snapshot_steps
+            return True
+
+    def _run(self):
+        """Takes steps whenever they are requested or while playing, publishing a snapshot after each one"""
+        engine = None
+        patched_rows = np.empty(0, dtype=np.intp)
+        epoch = 0
+        steps = 0
+        next_time = time.perf_counter()
+        while True:
+            with self._condition:
+                # Sleep until there is something to do (and while playing, until the next step is due)
+                while True:
+                    if self._stopping and self._pending_steps == 0:
+                        return
+                    if self._packed is not None or self._parameter_edits or self._weight_edits or self._pending_steps:
+                        break
+                    if self._playing:
+                        delay = next_time - time.perf_counter() if self.steps_per_second else 0
+                        if delay <= 0:
+                            break
+                        self._condition.wait(delay)
+                    else:
+                        self._condition.wait()
+                        next_time = time.perf_counter()
+
+                packed, self._packed = self._packed, None
+                edited_rows, self._edited_rows = self._edited_rows, None
+                parameter_edits, self._parameter_edits = self._parameter_edits, {}
+                weight_edits, self._weight_edits = self._weight_edits, {}
+                edited = packed is not None or parameter_edits or weight_edits
+                if not edited:
+                    if self._pending_steps > 0:
+                        self._pending_steps -= 1
+                    elif self.steps_per_second:
+                        next_time = max(next_time + 1 / self.steps_per_second, time.perf_counter() - 1)
+                epoch = self._epoch if edited else epoch
+
+            if packed is not None:
+                # Rebuild the private engine after a reload, carrying on from the values it had reached
+                if engine is not None and edited_rows is not None:
+                    values = engine.values.copy()
+                    values[edited_rows] = packed["values"][edited_rows]
+                    packed["values"] = values
+                engine = CompiledNetwork(None, packed)
+                patched_rows = np.empty(0, dtype=np.intp)
+            if parameter_edits or weight_edits:
+                patched_rows = np.union1d(patched_rows, self._patch(engine, parameter_edits, weight_edits))
+            if not edited:
+                # Only the rows that can still change are recomputed once the network starts to settle
+                engine.step_incremental(patched_rows)
+                patched_rows = np.empty(0, dtype=np.intp)
+                steps += 1
+            if self.recorder is not None:
+                self.recorder.record(engine.values, steps)
+            self._publish(engine.values, epoch, steps)
+
+    @staticmethod
+    def _patch(engine, parameter_edits, weight_edits):
+        """Writes edited numbers into the arrays and weight matrix of an engine in place
+
+        Args:
+            engine (CompiledNetwork): the engine of the worker
+            parameter_edits (dict): the (value, bias, decay) of every edited code
+            weight_edits (dict): the weight of every edited (source code, target code) pair
+
+        Returns:
+            np.ndarray: the rows the next step has to recompute
+        """
+        codes = [code for code in parameter_edits if code in engine.code_rows]
+        rows = np.array([engine.code_rows[code] for code in codes], dtype=np.intp)
+        if codes:
+            numbers = np.array([parameter_edits[code] for code in codes])
+            engine.values[rows] = numbers[:, 0]
+            engine.biases[rows] = numbers[:, 1]
+            engine.decays[rows] = numbers[:, 2]
+
+        # A connection that the engine does not have yet needs a reload, not a patch
+        targets = []
+        for (source_code, target_code), weight in weight_edits.items():
+            if source_code not in engine.code_rows or target_code not in engine.code_rows:
+                continue
+            target_row = engine.code_rows[target_code]
+            position = engine.link_position(engine.code_rows[source_code], target_row)
+            if position is not None:
+                engine.weights.data[position] = weight
+                targets.append(target_row)
+        return np.union1d(rows, np.array(targets, dtype=np.intp))
+
+    def _publish(self, values, epoch, steps):
+        """Fills the back buffer outside the lock, then swaps it to the front"""
+        back = 1 - self._front
+        np.copyto(self._buffers[back], values)
+        with self._condition:
+            self._front = back
+            self._generation += 1
+            self._snapshot_epoch = epoch
+            self._snapshot_steps = steps
+            notify = not self._notified
+            self._notified = True
+        if notify and self.on_snapshot is not None:
+            self.on_snapshot()
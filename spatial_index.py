@@ -0,0 +1,101 @@
+"""Buckets positioned items into a uniform grid so hit-testing, hovering and box selection do not scan every item"""
+import math
+
+
+class SpatialGrid:
+    """Indexes items by position in square cells, so the items near a position are found in O(1) on average
+
+    Items are returned in the order they were inserted, which keeps the draw order of overlapping neurons.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.count = 0
+
+    def cell_of(self, x, y):
+        """Returns the cell containing a position"""
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, item, x, y):
+        """Adds an item at a position
+
+        Args:
+            item (object): the item to index
+            x (float): the x coordinate of the item
+            y (float): the y coordinate of the item
+        """
+        self.cells.setdefault(self.cell_of(x, y), []).append((self.count, item, x, y))
+        self.count += 1
+
+    def _entries_in(self, left, top, right, bottom):
+        """Returns the (order, item, x, y) entries inside a box, edges included, in insertion order"""
+        first_x, first_y = self.cell_of(left, top)
+        last_x, last_y = self.cell_of(right, bottom)
+
+        # Visit whichever is fewer, the cells covered by the box or the occupied cells
+        if (last_x - first_x + 1) * (last_y - first_y + 1) <= len(self.cells):
+            cells = (self.cells.get((cell_x, cell_y), ())
+                     for cell_x in range(first_x, last_x + 1)
+                     for cell_y in range(first_y, last_y + 1))
+        else:
+            cells = self.cells.values()
+
+        found = [entry
+                 for cell in cells
+                 for entry in cell
+                 if left <= entry[2] <= right and top <= entry[3] <= bottom]
+        found.sort(key=lambda entry: entry[0])
+        return found
+
+    def query_rect(self, left, top, right, bottom):
+        """Returns the items inside a box, edges included, in insertion order
+
+        Args:
+            left (float): the smallest x coordinate of the box
+            top (float): the smallest y coordinate of the box
+            right (float): the largest x coordinate of the box
+            bottom (float): the largest y coordinate of the box
+        """
+        return [item for _, item, _, _ in self._entries_in(left, top, right, bottom)]
+
+    def query_box(self, x, y, half_size):
+        """Returns the items within a square centered on a position, in insertion order
+
+        Args:
+            x (float): the x coordinate of the center
+            y (float): the y coordinate of the center
+            half_size (float): half the width of the square
+        """
+        return self.query_rect(x - half_size, y - half_size, x + half_size, y + half_size)
+
+    def nearest(self, x, y, radius):
+        """Returns the item closest to a position within a radius, or None if there is none
+
+        Args:
+            x (float): the x coordinate of the position
+            y (float): the y coordinate of the position
+            radius (float): the largest distance an item may be away
+        """
+        best = None
+        best_distance = radius * radius
+        for _, item, item_x, item_y in self._entries_in(x - radius, y - radius, x + radius, y + radius):
+            distance = (item_x - x) ** 2 + (item_y - y) ** 2
+            if distance <= best_distance:
+                best = item
+                best_distance = distance
+        return best
+
+
+def build_neuron_grid(neurons, cell_size=64):
+    """Indexes neurons by their KGML position
+
+    Args:
+        neurons (iterable): the neurons to index
+        cell_size (float): the width of a grid cell in KGML coordinates
+    """
+    grid = SpatialGrid(cell_size)
+    for neuron in neurons:
+        n_x, n_y = neuron.pos
+        grid.insert(neuron, n_x, n_y)
+    return grid
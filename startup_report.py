@@ -0,0 +1,89 @@
+"""Reports which imports dominate the start-up time of a module, using python -X importtime
+
+Example:
+    python startup_report.py make_gui create_visual batch_runner --top 10
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Modules that should only be loaded once a simulation is run
+HEAVY_MODULES = ("pygame", "numpy", "scipy", "xml.etree.ElementTree", "create_visual", "engine")
+
+
+def measure_imports(module, python=sys.executable):
+    """Imports a module in a fresh interpreter and collects its -X importtime output
+
+    Args:
+        module (str): the module to import
+        python (str): the interpreter to run
+
+    Returns:
+        tuple: the wall time in seconds, a list of (module, self us, cumulative us, depth) rows and any error text
+    """
+    start = time.perf_counter()
+    result = subprocess.run([python, "-X", "importtime", "-c", "import " + module],
+                            capture_output=True,
+                            text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)),
+                            check=False)
+    wall = time.perf_counter() - start
+
+    rows = []
+    errors = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            errors.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            # Skip the column header
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(fields[0]), int(fields[1]), depth))
+
+    error = "\n".join(errors) if result.returncode != 0 else ""
+    return wall, rows, error
+
+
+def report(module, top):
+    """Prints the start-up summary of one module
+
+    Args:
+        module (str): the module to import
+        top (int): how many of the slowest imports to list
+    """
+    wall, rows, error = measure_imports(module)
+    print(f"== import {module}: {wall * 1000:.1f} ms wall")
+    if error:
+        print("   import failed:")
+        print("   " + error.replace("\n", "\n   "))
+
+    # The shallowest rows are the imports made directly by the module and its interpreter start-up
+    if rows:
+        total = sum(cumulative for _, _, cumulative, depth in rows if depth == min(row[3] for row in rows))
+        print(f"   {total / 1000:.1f} ms spent importing")
+    for name, self_us, cumulative, _ in sorted(rows, key=lambda row: row[2], reverse=True)[:top]:
+        print(f"   {cumulative / 1000:9.1f} ms cumulative {self_us / 1000:9.1f} ms self   {name}")
+
+    loaded = [name for name in HEAVY_MODULES if any(row[0] == name for row in rows)]
+    print("   heavy modules loaded at start-up: " + (", ".join(loaded) if loaded else "none"))
+
+
+def main(argv=None):
+    """Reports the start-up imports of every module named on the command line"""
+    parser = argparse.ArgumentParser(description="Summarize python -X importtime for the application modules")
+    parser.add_argument("modules", nargs="*", default=["make_gui"], help="modules to import (default: make_gui)")
+    parser.add_argument("--top", type=int, default=15, help="how many of the slowest imports to list")
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        report(module, args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Records the values of a network step by step in a fixed amount of memory, for playback and export"""
+import csv
+import threading
+
+import numpy as np
+
+
+class TrajectoryRecorder:
+    """Keeps the latest frames of values in a preallocated float32 ring buffer
+
+    A frame is the values of one step, one per code, or one column per scenario when scenarios are propagated
+    together. Once the buffer is full every new frame replaces the oldest one. For long runs the buffer can live in a
+    memory-mapped .npy file instead of memory, so only the frames being read or written are paged in. A frame recorded
+    again for the same step replaces the previous one, which keeps an edit made between steps from doubling a step.
+
+    Args:
+        frame_shape (int or tuple): the shape of one frame of values
+        capacity (int): the number of frames kept, older frames are dropped first
+        spill_path (str): a .npy file to keep the frames in instead of memory
+    """
+
+    def __init__(self, frame_shape, capacity=1024, spill_path=None):
+        self.frame_shape = (frame_shape,) if isinstance(frame_shape, int) else tuple(frame_shape)
+        self.capacity = capacity
+        self.spill_path = spill_path
+        if spill_path is None:
+            self.frames = np.empty((capacity,) + self.frame_shape, dtype=np.float32)
+        else:
+            self.frames = np.lib.format.open_memmap(spill_path, mode="w+", dtype=np.float32,
+                                                    shape=(capacity,) + self.frame_shape)
+        self.steps = np.empty(capacity, dtype=np.int64)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def record(self, values, step=None):
+        """Stores the values of one step, overwriting the oldest frame once the buffer is full
+
+        Args:
+            values (np.ndarray): the values of the step, shaped like a frame
+            step (int): the step the values belong to (defaults to the step after the last recorded one)
+        """
+        with self._lock:
+            last = self.steps[(self.total - 1) % self.capacity] if self.total else None
+            if step is None:
+                step = 0 if last is None else last + 1
+            elif step == last:
+                # Replace the frame of a step that was recorded already
+                self.total -= 1
+            slot = self.total % self.capacity
+            np.copyto(self.frames[slot], values, casting="same_kind")
+            self.steps[slot] = step
+            self.total += 1
+
+    def _order(self):
+        """Returns the slots of the kept frames from oldest to newest"""
+        count = len(self)
+        return (np.arange(count) + (self.total - count)) % self.capacity
+
+    def frame(self, index):
+        """Returns the step and a copy of the values of a kept frame
+
+        Args:
+            index (int): the position of the frame from the oldest (0) to the newest (-1 or len - 1)
+        """
+        with self._lock:
+            count = len(self)
+            if not -count <= index < count:
+                raise IndexError(index)
+            slot = (self.total - count + index % count) % self.capacity
+            return int(self.steps[slot]), np.array(self.frames[slot])
+
+    def history(self):
+        """Returns the steps and a (frames x frame shape) copy of the values of the kept frames, oldest first"""
+        with self._lock:
+            order = self._order()
+            return self.steps[order], np.array(self.frames[order])
+
+    def clear(self):
+        """Forgets every frame"""
+        with self._lock:
+            self.total = 0
+
+    def export_npz(self, path, codes=None):
+        """Writes the kept frames as NumPy arrays "steps" and "values", and the "codes" of the rows if given
+
+        Args:
+            path (str): the .npz file to write
+            codes (list): the code of every row of a frame
+        """
+        steps, values = self.history()
+        arrays = {"steps": steps, "values": values}
+        if codes is not None:
+            arrays["codes"] = np.array(codes, dtype=str)
+        np.savez(path, **arrays)
+
+    def export_csv(self, path, codes=None, scenarios=None):
+        """Writes the kept frames as CSV, one row per step (and per scenario for frames with scenario columns)
+
+        Args:
+            path (str): the .csv file to write
+            codes (list): the code of every row of a frame (defaults to the row numbers)
+            scenarios (list): the label of every column of a frame with scenario columns (defaults to their numbers)
+        """
+        steps, values = self.history()
+        codes = list(codes) if codes is not None else list(range(self.frame_shape[0]))
+        with open(path, "w", newline="", encoding="utf8") as file:
+            writer = csv.writer(file)
+            if len(self.frame_shape) == 1:
+                writer.writerow(["step"] + codes)
+                for step, row in zip(steps.tolist(), values.tolist()):
+                    writer.writerow([step] + row)
+                return
+
+            # Frames of several scenarios get one row per scenario of every step
+            if scenarios is None:
+                scenarios = list(range(self.frame_shape[1]))
+            writer.writerow(["step", "scenario"] + codes)
+            for step, frame in zip(steps.tolist(), values):
+                for label, row in zip(scenarios, frame.T.tolist()):
+                    writer.writerow([step, label] + row)
+
+    def close(self):
+        """Writes a memory-mapped buffer out to its file"""
+        if self.spill_path is not None:
+            self.frames.flush()